@@ -0,0 +1,227 @@
+import asyncio
+import weakref
+
+from mpt import db
+from mpt.cache import LRUCache
+from mpt.codec import decode_node, encode_node
+from mpt.trie import (
+    BLANK,
+    BLANK_NODE,
+    BRANCH,
+    EXTENSION,
+    LEAF,
+    _open_tries,
+    common_prefix_length,
+    get_node_type,
+    make_node,
+    nibble_at,
+    path_range,
+)
+
+
+class AsyncDB:
+    """
+    Interface of an asynchronous key/value store the AsyncTrie reads its nodes from
+    """
+
+    async def get(self, key: bytes) -> bytes:
+        """
+        :param key: Key of the entry
+        :return: Stored data or None if the key does not exist
+        """
+        raise NotImplementedError
+
+    async def multi_get(self, keys: list) -> list:
+        """
+        :param keys: List of keys
+        :return: List with the data (or None) of every key in the same order
+        """
+        return list(await asyncio.gather(*(self.get(key) for key in keys)))
+
+
+class ThreadPoolDB(AsyncDB):
+    def __init__(self, store: db.BaseDB, executor=None):
+        """
+        Runs the blocking calls of a storage backend in a thread pool, so they do not stall the event loop
+
+        :param store: Backend, e.g. db.DB or db.SQLiteDB
+        :param executor: concurrent.futures executor, defaults to the default executor of the loop
+        """
+        self.store = store
+        self.executor = executor
+
+    async def get(self, key: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.store.get, key)
+
+    async def multi_get(self, keys: list) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.store.multi_get, keys)
+
+
+class AsyncTrie:
+    def __init__(self, path, root_hash: bytes, cache_size: int = 0):
+        """
+        Read access to a trie for asyncio applications. Nodes are resolved by awaiting the backend, lookups which
+        run at the same time share the fetch of a node they both need. A reader on a blocking backend is registered
+        like an open Trie, so Trie.prune on the same backend keeps the nodes of its root. Readers on other AsyncDB
+        implementations have to be covered by the keep_roots of prune.
+
+        :param path (str, db.BaseDB or AsyncDB): Path of a LevelDB database or a storage backend. Blocking backends
+                                                 are run in the default thread pool.
+        :param root_hash (bytes): Root hash of the trie
+        :param cache_size (int): Budget in bytes (of encoded nodes) for the cache of decoded nodes, 0 disables it
+        """
+        if not isinstance(path, AsyncDB):
+            path = ThreadPoolDB(path if isinstance(path, db.BaseDB) else db.DB(path))
+        self.db = path
+        if isinstance(path, ThreadPoolDB):
+            _open_tries.setdefault(path.store, weakref.WeakSet()).add(self)
+        self.cache = LRUCache(cache_size) if cache_size else None
+        # hash -> future of the decoded node, for nodes which are being fetched
+        self._in_flight = {}
+        self.root_hash = root_hash
+        self._root_node = None
+
+    def set_root_hash(self, root_hash: bytes) -> None:
+        """
+        :param root_hash: Root hash of the trie which is read from now on
+        """
+        self.root_hash = root_hash
+        self._root_node = None
+
+    async def get_value(self, key: bytes) -> bytes:
+        """
+        Takes a key and returns the value stored under that key
+
+        :param key: bytes with length <= 32
+        :return: The value, or empty bytes if there is no value
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        node = await self._get_root_node()
+        key_end = len(key) * 2
+        pos = 0
+        while True:
+            node_type = get_node_type(node)
+            if node_type == BLANK:
+                return BLANK_NODE
+
+            if node_type == BRANCH:
+                if pos == key_end:
+                    return node[16]
+                node = await self._decode_to_node(node[nibble_at(key, pos)])
+                pos += 1
+                continue
+
+            curr_start, curr_end = path_range(node[0])
+            curr_length = curr_end - curr_start
+            if (
+                common_prefix_length(node[0], curr_start, curr_end, key, pos, key_end)
+                < curr_length
+            ):
+                return BLANK_NODE
+
+            if node_type == LEAF:
+                return node[1] if key_end - pos == curr_length else BLANK_NODE
+
+            node = await self._decode_to_node(node[1])
+            pos += curr_length
+
+    async def get_many(self, keys: list) -> list:
+        """
+        Looks up several keys concurrently, nodes on shared paths are fetched once
+
+        :param keys: List of keys, bytes with length <= 32
+        :return: List with the values of the keys in the same order
+        """
+        return list(await asyncio.gather(*(self.get_value(key) for key in keys)))
+
+    async def get_proof(self, key: bytes) -> list:
+        """
+        Like Trie.get_proof
+
+        :param key: bytes with length <= 32
+        :return: List of rlp encoded nodes, starting with the root node
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        node = await self._get_root_node()
+        # stored nodes do not keep their encoding, encoding them again gives the same bytes
+        proof = [encode_node(node)]
+        key_end = len(key) * 2
+        pos = 0
+        while True:
+            node_type = get_node_type(node)
+            if node_type == BRANCH and pos < key_end:
+                ref = node[nibble_at(key, pos)]
+                pos += 1
+            elif node_type == EXTENSION:
+                curr_start, curr_end = path_range(node[0])
+                if (
+                    common_prefix_length(
+                        node[0], curr_start, curr_end, key, pos, key_end
+                    )
+                    < curr_end - curr_start
+                ):
+                    return proof
+                ref = node[1]
+                pos += curr_end - curr_start
+            else:
+                return proof
+
+            node = await self._decode_to_node(ref)
+            if isinstance(ref, bytes) and len(ref) == 32:
+                proof.append(encode_node(node))
+
+    async def _get_root_node(self) -> list:
+        if self._root_node is None:
+            if len(self.root_hash) == 0:
+                self._root_node = BLANK_NODE
+            else:
+                self._root_node = await self._decode_to_node(self.root_hash)
+        return self._root_node
+
+    async def _decode_to_node(self, encoded) -> list:
+        """
+        Like Trie._decode_to_node, but the db is awaited. If the node is already being fetched for another lookup,
+        the same fetch is awaited.
+
+        :param encoded: Node encoded in either rlp or by a hash
+        :return: Decoded node
+        """
+        if encoded == BLANK_NODE:
+            return BLANK_NODE
+        if isinstance(encoded, list):
+            return encoded
+        if self.cache is not None:
+            node = self.cache.get(encoded)
+            if node is not None:
+                return node
+
+        future = self._in_flight.get(encoded)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(encoded))
+            self._in_flight[encoded] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(encoded, None))
+        # a cancelled lookup must not cancel the fetch for the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, hash_key: bytes) -> list:
+        rlp_node = await self.db.get(hash_key)
+        if rlp_node is None:
+            raise Exception("Node %s is missing in the db" % hash_key.hex())
+        node = decode_node(rlp_node)
+        if node != BLANK_NODE:
+            node = make_node(node, rlp_node, hash_key)
+        if self.cache is not None:
+            self.cache.put(hash_key, node, len(rlp_node))
+        return node
@@ -0,0 +1,343 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from mpt import db, utils
+from mpt.codec import encode_node
+from mpt.trie import (
+    BLANK_NODE,
+    BRANCH,
+    LEAF,
+    CommitStats,
+    bin_to_nibbles,
+    common_prefix_length,
+    get_node_type,
+    nibble_at,
+    pack_nibble_range,
+    pack_nibbles,
+    unpack_to_nibbles,
+)
+
+
+def _build_subtree(items: list, depth: int) -> (list, list):
+    """
+    Builds the subtree of a group of keys which share their first nibbles. Runs in a worker of build_parallel.
+
+    :param items: List of (key, value) pairs in ascending key order
+    :param depth: Number of nibbles all keys have in common
+    :return: The hashed nodes as (hash, rlp) pairs and the node of the subtree, whose path starts at depth
+    """
+    store = db.MemoryDB()
+    builder = TrieBuilder(store)
+    for key, value in items:
+        builder.add(key, value)
+    node = builder._make_node(builder._collapse(-1), depth)
+    builder._flush()
+    return list(store.iterate_prefix()), node
+
+
+class TrieBuilder:
+    def __init__(self, path, batch_size: int = 10000):
+        """
+        Builds a trie from key/value pairs which arrive in ascending key order. A subtree is hashed and written
+        exactly once, as soon as no later key can end up in it, so only the path of the last key is kept in memory.
+
+        :param path (str or db.BaseDB): Path where to store the LevelDB database, or a storage backend instance
+        :param batch_size (int): Number of nodes which are collected before they are written in one batch
+        """
+        self.db = path if isinstance(path, db.BaseDB) else db.DB(path)
+        self.batch_size = batch_size
+        self.nodes = 0
+        self.bytes = 0
+        self._batch = []
+        self._prev_key = None
+        self._prev_value = None
+        # open branch nodes along the path of the previous key as [depth, children]
+        self._stack = []
+
+    def build(self, items) -> bytes:
+        """
+        Adds all key/value pairs and finishes the trie
+
+        :param items: Iterable of (key, value) pairs in ascending key order
+        :return: Root hash of the trie
+        """
+        for key, value in items:
+            self.add(key, value)
+        return self.finish()
+
+    def build_parallel(
+        self,
+        items,
+        max_workers: int = None,
+        fan_out: int = 1,
+        executor=None,
+        max_pending: int = None,
+    ) -> bytes:
+        """
+        Like build, but the subtrees below the first fan_out levels are built and hashed in a pool of workers. The
+        keys are grouped by their first fan_out nibbles (16 groups for 1, 256 for 2), afterwards the top levels are
+        built from the nodes of the groups. The empty key has no nibble to be grouped by, its value goes into the
+        top branch node. The root hash is the same as the one of build.
+
+        :param items: Iterable of (key, value) pairs in ascending key order
+        :param max_workers: Number of worker processes, defaults to the number of CPUs
+        :param fan_out: Number of nibbles the keys are grouped by, 1 or 2
+        :param executor: concurrent.futures executor to be used instead of a new process pool
+        :param max_pending: Number of groups which are kept in memory at the same time, defaults to twice the
+                            number of workers
+        :return: Root hash of the trie
+        """
+        if fan_out not in (1, 2):
+            raise Exception("fan_out must be 1 or 2")
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers)
+        if max_pending is None:
+            max_pending = 2 * (max_workers or os.cpu_count() or 1)
+        groups = {}
+        pending = deque()
+        # value of the empty key, None if there is none
+        top_value = None
+
+        def collect():
+            prefix, future = pending.popleft()
+            nodes, node = future.result()
+            for hash_key, rlp_node in nodes:
+                self._put(hash_key, rlp_node)
+            groups[prefix] = node
+
+        try:
+            group = []
+            group_prefix = None
+            for key, value in items:
+                self._check(key, value)
+                self._prev_key = key
+                if not key:
+                    top_value = value
+                    continue
+                prefix = key[:1] if fan_out == 2 else key[0] >> 4
+                if prefix != group_prefix and group:
+                    pending.append(
+                        (group_prefix, executor.submit(_build_subtree, group, fan_out))
+                    )
+                    group = []
+                    if len(pending) >= max_pending:
+                        collect()
+                group_prefix = prefix
+                group.append((key, value))
+            if group:
+                pending.append(
+                    (group_prefix, executor.submit(_build_subtree, group, fan_out))
+                )
+            while pending:
+                collect()
+        finally:
+            self._prev_key = None
+            if own_executor:
+                executor.shutdown()
+
+        nibble_groups = {
+            tuple(bin_to_nibbles(prefix) if fan_out == 2 else [prefix]): node
+            for prefix, node in groups.items()
+        }
+        if top_value is not None:
+            root_node = self._merge_top(nibble_groups, top_value)
+        else:
+            root_node = self._merge(nibble_groups, 0) if groups else BLANK_NODE
+        rlp_root = encode_node(root_node)
+        root_hash = utils.sha3(rlp_root)
+        self._put(root_hash, rlp_root)
+        self._flush()
+        return root_hash
+
+    def add(self, key: bytes, value: bytes) -> None:
+        """
+        Adds a key/value pair. Like Trie.update, an empty value is stored and does not delete the key.
+
+        :param key: bytes with length <= 32, greater than the previously added key
+        :param value: bytes
+        """
+        self._check(key, value)
+
+        if self._prev_key is not None:
+            prev = self._prev_key
+            self._collapse(
+                common_prefix_length(prev, 0, len(prev) * 2, key, 0, len(key) * 2)
+            )
+
+        self._prev_key = key
+        self._prev_value = value
+
+    def finish(self) -> bytes:
+        """
+        Writes the remaining nodes and the root node to the database
+
+        :return: Root hash of the trie
+        """
+        if self._prev_key is None:
+            root_node = BLANK_NODE
+        else:
+            root_node = self._make_node(self._collapse(-1), 0)
+
+        rlp_root = encode_node(root_node)
+        root_hash = utils.sha3(rlp_root)
+        self._put(root_hash, rlp_root)
+        self._flush()
+
+        self._prev_key = self._prev_value = None
+        return root_hash
+
+    def _check(self, key: bytes, value: bytes) -> None:
+        """
+        Checks the types and the order of a new key/value pair
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        if not isinstance(value, bytes):
+            raise Exception("Value must be bytes")
+
+        if self._prev_key is not None and key <= self._prev_key:
+            raise Exception("Keys must be added in strictly ascending order")
+
+    def _merge_top(self, groups: dict, value: bytes) -> list:
+        """
+        Builds the root node if there is a value for the empty key
+
+        :param groups: Dict which maps the nibbles of a group prefix to the node of the group
+        :param value: Value of the empty key
+        :return: The root node
+        """
+        if not groups:
+            return [pack_nibbles([], True), value]
+
+        # like in the trie, the root stays a branch node even if all other keys share their first nibble
+        branch = [BLANK_NODE] * 17
+        by_nibble = {}
+        for prefix, node in groups.items():
+            by_nibble.setdefault(prefix[0], {})[prefix] = node
+        for nibble, sub_groups in by_nibble.items():
+            branch[nibble] = self._encode_node(self._merge(sub_groups, 1))
+        branch[16] = value
+        return branch
+
+    def _merge(self, groups: dict, depth: int) -> list:
+        """
+        Builds the top levels of the trie from the nodes of the key groups
+
+        :param groups: Dict which maps the nibbles of a group prefix to the node of the group
+        :param depth: Number of nibbles which are already covered by the path to the new node
+        :return: The node whose path starts at depth
+        """
+        prefixes = list(groups)
+        if depth == len(prefixes[0]):
+            return groups[prefixes[0]]
+
+        by_nibble = {}
+        for prefix in prefixes:
+            by_nibble.setdefault(prefix[depth], {})[prefix] = groups[prefix]
+
+        if len(by_nibble) > 1:
+            branch = [BLANK_NODE] * 17
+            for nibble, sub_groups in by_nibble.items():
+                branch[nibble] = self._encode_node(self._merge(sub_groups, depth + 1))
+            return branch
+
+        # all groups share this nibble, so it becomes part of the path of the node below
+        nibble, sub_groups = by_nibble.popitem()
+        node = self._merge(sub_groups, depth + 1)
+        node_type = get_node_type(node)
+        if node_type == BRANCH:
+            return [pack_nibbles([nibble], False), self._encode_node(node)]
+        return [
+            pack_nibbles([nibble] + unpack_to_nibbles(node[0]), node_type == LEAF),
+            node[1],
+        ]
+
+    def stats(self) -> CommitStats:
+        """
+        :return: Number of nodes and bytes which have been written so far
+        """
+        return CommitStats(self.nodes, self.bytes)
+
+    def _collapse(self, depth: int):
+        """
+        Finalizes everything on the path of the previous key which lies below the given depth. Afterwards the
+        remaining subtree is hooked into the branch node at depth, which is created if needed.
+
+        :param depth: Length of the common prefix of the previous and the next key, -1 to finalize the whole trie
+        :return: The pending subtree in case depth is -1
+        """
+        key = self._prev_key
+        # the pending subtree is either the previous leaf, or a finished branch node (children, depth)
+        pending = (self._prev_value, None)
+        while self._stack and self._stack[-1][0] > depth:
+            branch_depth, children = self._stack.pop()
+            children[nibble_at(key, branch_depth)] = self._encode_node(
+                self._make_node(pending, branch_depth + 1)
+            )
+            pending = (children, branch_depth)
+
+        if depth < 0:
+            return pending
+
+        if not self._stack or self._stack[-1][0] < depth:
+            self._stack.append([depth, [BLANK_NODE] * 17])
+        children = self._stack[-1][1]
+        if depth == len(key) * 2:
+            # the previous key is a prefix of the next one, so its value goes into the branch node
+            children[16] = self._prev_value
+        else:
+            children[nibble_at(key, depth)] = self._encode_node(
+                self._make_node(pending, depth + 1)
+            )
+
+    def _make_node(self, pending: tuple, start: int) -> list:
+        """
+        Turns a pending subtree into a node whose path starts at the given nibble of the previous key
+
+        :param pending: Value of a leaf node, or children and depth of a branch node
+        :param start: Position in the previous key where the path of the node starts
+        :return: A list which represents a node
+        """
+        key = self._prev_key
+        payload, branch_depth = pending
+        if branch_depth is None:
+            return [pack_nibble_range(key, start, len(key) * 2, True), payload]
+        if branch_depth > start:
+            return [
+                pack_nibble_range(key, start, branch_depth, False),
+                self._encode_node(payload),
+            ]
+        return payload
+
+    def _encode_node(self, node: list):
+        """
+        Encodes a node like Trie._encode_node: small nodes are inlined, bigger nodes are stored under their hash.
+
+        :param node: A list which represents a node
+        :return: The node itself or its hash
+        """
+        rlp_node = encode_node(node)
+        if len(rlp_node) < 32:
+            return node
+        hash_key = utils.sha3(rlp_node)
+        self._put(hash_key, rlp_node)
+        return hash_key
+
+    def _put(self, key: bytes, data: bytes) -> None:
+        self._batch.append((key, data))
+        self.nodes += 1
+        self.bytes += len(data)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self.db.write_batch(self._batch)
+            self._batch = []
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheStats = namedtuple(
+    "CacheStats", ["hits", "misses", "evictions", "size", "max_size"]
+)
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        """
+        Cache which evicts the least recently used entries once the sum of the entry sizes exceeds max_size. It can
+        be shared by several threads.
+
+        :param max_size: Budget of the cache, in the same unit as the sizes passed to put (e.g. bytes)
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, size), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value and marks it as most recently used
+
+        :param key: Key of the entry
+        :return: The cached value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size: int) -> None:
+        """
+        Adds an entry to the cache and evicts old entries until the cache fits into its budget again
+
+        :param key: Key of the entry
+        :param value: Value to be cached
+        :param size: Size of the entry
+        """
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self.hits, self.misses, self.evictions, self.size, self.max_size
+        )
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,144 @@
+from rlp import DecodingError, EncodingError
+
+# headers of byte strings and lists with a payload of less than 56 bytes
+_SHORT_BYTES = [bytes([0x80 + length]) for length in range(56)]
+_SHORT_LIST = [bytes([0xC0 + length]) for length in range(56)]
+
+
+def encode_node(node) -> bytes:
+    """
+    rlp encodes a trie node, the result is the same as the one of rlp.encode. A node is a list of byte strings and
+    inline nodes; a blank node or a value is a byte string.
+
+    :param node: A list which represents a node, or bytes
+    :return: rlp encoding of the node
+    """
+    if isinstance(node, bytes):
+        return b"".join(_encode_bytes(node))
+    pieces = []
+    _encode_list(node, pieces)
+    return b"".join(pieces)
+
+
+def _encode_bytes(data: bytes) -> list:
+    length = len(data)
+    if length == 1 and data[0] < 0x80:
+        return [data]
+    if length < 56:
+        return [_SHORT_BYTES[length], data]
+    return [_long_header(0xB7, length), data]
+
+
+def _encode_list(items: list, pieces: list) -> int:
+    """
+    Appends the encoding of a list to the pieces. The header is filled in once the length of the payload is known,
+    so all pieces are joined into one buffer at the end.
+
+    :param items: List of byte strings and lists
+    :param pieces: List of byte strings the encoding is appended to
+    :return: Length of the encoding
+    """
+    header_index = len(pieces)
+    pieces.append(None)
+    length = 0
+    for item in items:
+        if isinstance(item, bytes):
+            item_length = len(item)
+            if item_length == 1 and item[0] < 0x80:
+                pieces.append(item)
+                length += 1
+            elif item_length < 56:
+                pieces.append(_SHORT_BYTES[item_length])
+                pieces.append(item)
+                length += 1 + item_length
+            else:
+                header = _long_header(0xB7, item_length)
+                pieces.append(header)
+                pieces.append(item)
+                length += len(header) + item_length
+        elif isinstance(item, list):
+            length += _encode_list(item, pieces)
+        else:
+            raise EncodingError("Cannot encode %r as part of a node" % (item,), item)
+
+    if length < 56:
+        header = _SHORT_LIST[length]
+    else:
+        header = _long_header(0xF7, length)
+    pieces[header_index] = header
+    return len(header) + length
+
+
+def _long_header(offset: int, length: int) -> bytes:
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([offset + len(length_bytes)]) + length_bytes
+
+
+def decode_node(data) -> list:
+    """
+    Decodes an rlp encoded trie node, the result is the same as the one of rlp.decode. The input is parsed in place,
+    only the byte strings of the node are copied out of it.
+
+    :param data: rlp encoding as bytes, bytearray or memoryview
+    :return: A list which represents the node, or bytes for a blank node
+    """
+    if not isinstance(data, bytes):
+        if not isinstance(data, (bytearray, memoryview)):
+            raise DecodingError("Can only decode rlp bytes, got %s" % type(data), data)
+        data = bytes(data)
+    item, end = _decode_item(data, 0)
+    if end != len(data):
+        raise DecodingError("Trailing bytes after the node", data)
+    return item
+
+
+def _decode_item(data: bytes, pos: int):
+    """
+    :param data: rlp encoded data
+    :param pos: Position of the item in the data
+    :return: The decoded item and the position after it
+    """
+    if pos >= len(data):
+        raise DecodingError("Node is truncated", data)
+    prefix = data[pos]
+    if prefix < 0x80:
+        return data[pos : pos + 1], pos + 1
+
+    if prefix < 0xC0:
+        start, end = _payload_range(data, pos, prefix, 0x80)
+        if end - start == 1 and data[start] < 0x80:
+            raise DecodingError("Single byte is not encoded canonically", data)
+        return data[start:end], end
+
+    start, end = _payload_range(data, pos, prefix, 0xC0)
+    items = []
+    pos = start
+    while pos < end:
+        item, pos = _decode_item(data, pos)
+        items.append(item)
+    if pos != end:
+        raise DecodingError("List payload does not match its length", data)
+    return items, end
+
+
+def _payload_range(data: bytes, pos: int, prefix: int, offset: int) -> (int, int):
+    """
+    :return: Start and end of the payload of a byte string (offset 0x80) or a list (offset 0xc0)
+    """
+    short_length = prefix - offset
+    if short_length < 56:
+        start = pos + 1
+        end = start + short_length
+    else:
+        length_size = short_length - 55
+        length_bytes = data[pos + 1 : pos + 1 + length_size]
+        if len(length_bytes) != length_size or length_bytes[0] == 0:
+            raise DecodingError("Length is not encoded canonically", data)
+        length = int.from_bytes(length_bytes, "big")
+        if length < 56:
+            raise DecodingError("Length is not encoded canonically", data)
+        start = pos + 1 + length_size
+        end = start + length
+    if end > len(data):
+        raise DecodingError("Node is truncated", data)
+    return start, end
@@ -1,13 +1,113 @@
-import plyvel
+import sqlite3
+import threading
 
+try:
+    import plyvel
+except ImportError:  # pragma: no cover - LevelDB is optional for the other backends
+    plyvel = None
 
-class DB:
+
+def prefix_upper_bound(prefix: bytes) -> bytes:
+    """
+    Returns the smallest key which is greater than every key starting with the given prefix.
+
+    :param prefix: Key prefix
+    :return: Exclusive upper bound, or None if there is no such key (prefix is empty or all 0xff)
+    """
+    prefix = prefix.rstrip(b"\xff")
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class BaseDB:
+    """
+    Interface of a key/value store the trie keeps its nodes in. Backends have to implement get, put, delete and
+    iterate_prefix, the batch operations fall back to single calls unless a backend can do better.
+    """
+
+    def get(self, key: bytes) -> bytes:
+        """
+        :param key: Key of the entry
+        :return: Stored data or None if the key does not exist
+        """
+        raise NotImplementedError
+
+    def put(self, key: bytes, data: bytes) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: bytes) -> None:
+        raise NotImplementedError
+
+    def iterate_prefix(self, prefix: bytes = b""):
+        """
+        Yields all (key, data) pairs whose key starts with the given prefix in ascending key order
+
+        :param prefix: Key prefix, empty to iterate over the whole store
+        """
+        raise NotImplementedError
+
+    def write_batch(self, puts=(), deletes=()) -> None:
+        """
+        Applies all puts and deletes, atomically if the backend supports it.
+
+        :param puts: Iterable of (key, data) pairs to be stored
+        :param deletes: Iterable of keys to be removed
+        """
+        for key, data in puts:
+            self.put(key, data)
+        for key in deletes:
+            self.delete(key)
+
+    def multi_get(self, keys: list) -> list:
+        """
+        :param keys: List of keys
+        :return: List with the stored data (or None) in the same order as the keys
+        """
+        return [self.get(key) for key in keys]
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryDB(BaseDB):
+    """
+    Backend which keeps everything in a dict. Useful for tests and if only the root hash is of interest.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def put(self, key, data):
+        self._data[key] = data
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def multi_get(self, keys):
+        return [self._data.get(key) for key in keys]
+
+    def iterate_prefix(self, prefix=b""):
+        for key in sorted(self._data):
+            if key.startswith(prefix):
+                yield key, self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DB(BaseDB):
     __instance = None
 
     def __init__(self, path, create_if_missing=True):
         """
         Virtually private constructor.
         """
+        if plyvel is None:
+            raise Exception("plyvel is required for the LevelDB backend")
         if self.__instance == None:
             self.__instance = plyvel.DB(path, create_if_missing=create_if_missing)
 
@@ -19,3 +119,124 @@ class DB:
 
     def delete(self, key):
         self.__instance.delete(key)
+
+    def write_batch(self, puts=(), deletes=()):
+        """
+        Applies all puts and deletes atomically within a single LevelDB write batch.
+
+        :param puts: Iterable of (key, data) pairs to be stored
+        :param deletes: Iterable of keys to be removed
+        """
+        with self.__instance.write_batch() as wb:
+            for key, data in puts:
+                wb.put(key, data)
+            for key in deletes:
+                wb.delete(key)
+
+    def iterate_prefix(self, prefix=b""):
+        with self.__instance.iterator(prefix=prefix) as it:
+            for key, data in it:
+                yield key, data
+
+    def close(self):
+        self.__instance.close()
+
+
+LevelDB = DB
+
+
+class SQLiteDB(BaseDB):
+    """
+    Backend which stores the entries in a single SQLite table, using the write-ahead log.
+    """
+
+    # SQLite limits the number of host parameters of a statement
+    MAX_VARIABLES = 500
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the database file, ":memory:" for a private in-memory database
+        """
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key BLOB PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (bytes(key),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                (bytes(key), bytes(data)),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (bytes(key),))
+
+    def write_batch(self, puts=(), deletes=()):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                    ((bytes(key), bytes(data)) for key, data in puts),
+                )
+                self._conn.executemany(
+                    "DELETE FROM kv WHERE key = ?", ((bytes(key),) for key in deletes)
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def multi_get(self, keys):
+        found = {}
+        keys = [bytes(key) for key in keys]
+        for i in range(0, len(keys), self.MAX_VARIABLES):
+            chunk = keys[i : i + self.MAX_VARIABLES]
+            query = "SELECT key, value FROM kv WHERE key IN (%s)" % ",".join(
+                "?" * len(chunk)
+            )
+            with self._lock:
+                found.update(self._conn.execute(query, chunk).fetchall())
+        return [found.get(key) for key in keys]
+
+    def iterate_prefix(self, prefix=b""):
+        # rows are fetched in pages, so the lock is not held while the caller consumes them
+        upper = prefix_upper_bound(prefix)
+        query = "SELECT key, value FROM kv WHERE key > ?"
+        if upper is not None:
+            query += " AND key < ?"
+        query += " ORDER BY key LIMIT %d" % self.MAX_VARIABLES
+
+        prefix = bytes(prefix)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, value FROM kv WHERE key = ?", (prefix,)
+            ).fetchone()
+        if row:
+            yield row
+        last = prefix
+        while True:
+            args = (last,) if upper is None else (last, upper)
+            with self._lock:
+                rows = self._conn.execute(query, args).fetchall()
+            yield from rows
+            if len(rows) < self.MAX_VARIABLES:
+                return
+            last = rows[-1][0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,262 @@
+import mmap
+import struct
+
+from mpt import db
+from mpt.codec import decode_node, encode_node
+from mpt.trie import (
+    BLANK_NODE,
+    BLANK_ROOT_HASH,
+    BRANCH,
+    EXTENSION,
+    LEAF,
+    CommitStats,
+    common_prefix_length,
+    get_node_type,
+    nibble_at,
+    path_range,
+)
+
+# start of a frozen trie file, followed by the offset of the root record and the root hash
+MAGIC = b"MPTFROZ1"
+HEADER = struct.Struct(">8sQ32s")
+# node type, 1 if the node is stored under its hash (0 for inline nodes), length of the rlp encoding
+RECORD = struct.Struct(">BBI")
+OFFSET = struct.Struct(">Q")
+
+
+def freeze(path, root_hash: bytes, filename: str) -> CommitStats:
+    """
+    Writes the trie of a root into a single immutable file, which can be served with FrozenTrie. Every node is
+    stored as a record with the file offsets of its children, followed by its rlp encoding, which still contains
+    the hashes for proofs. Children are written before their parents, subtrees which are referenced several times
+    are written once.
+
+    :param path (str or db.BaseDB): Path of the LevelDB database, or a storage backend instance
+    :param root_hash: Root hash of the trie
+    :param filename: Path of the file to be written
+    :return: Number of node records and bytes of the file
+    """
+    store = path if isinstance(path, db.BaseDB) else db.DB(path)
+    rlp_root = (
+        encode_node(BLANK_NODE)
+        if root_hash == BLANK_ROOT_HASH
+        else store.get(root_hash)
+    )
+    if rlp_root is None:
+        raise Exception("Root node %s is missing" % root_hash.hex())
+
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, root_hash))
+        writer = _Writer(store, f, HEADER.size)
+        root_node = decode_node(rlp_root)
+        root_offset = 0
+        if root_node != BLANK_NODE:
+            root_offset = writer.write_subtree(root_node, rlp_root, root_hash)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, root_offset, root_hash))
+    return CommitStats(writer.nodes, writer.offset)
+
+
+class _Writer:
+    def __init__(self, store: db.BaseDB, fileobj, offset: int):
+        self.store = store
+        self.fileobj = fileobj
+        self.offset = offset
+        self.nodes = 0
+        # hash -> offset of the records which have been written
+        self.written = {}
+
+    def write_subtree(self, node: list, rlp_node: bytes, hash_key: bytes) -> int:
+        """
+        Writes the records of a subtree in post order
+
+        :return: Offset of the record of the node
+        """
+        # one frame per node on the current path: node, rlp, hash, children, offsets of the written children
+        stack = [self._frame(node, rlp_node, hash_key)]
+        while True:
+            frame = stack[-1]
+            children = frame[3]
+            if children:
+                slot, child, rlp_child, child_hash = children.pop()
+                if child_hash in self.written:
+                    frame[4][slot] = self.written[child_hash]
+                else:
+                    stack.append(self._frame(child, rlp_child, child_hash, slot))
+                continue
+
+            stack.pop()
+            offset = self._write_record(*frame[:3], frame[4])
+            if frame[2] is not None:
+                self.written[frame[2]] = offset
+            if not stack:
+                return offset
+            stack[-1][4][frame[5]] = offset
+
+    def _frame(self, node, rlp_node, hash_key, slot=None) -> list:
+        node_type = get_node_type(node)
+        if node_type == BRANCH:
+            refs = [(i, node[i]) for i in range(16) if node[i] != BLANK_NODE]
+        elif node_type == EXTENSION:
+            refs = [(0, node[1])]
+        else:
+            refs = []
+
+        # the hashed children of a node are read in one batch
+        hashes = [ref for _, ref in refs if not isinstance(ref, list)]
+        rlp_nodes = dict(zip(hashes, self.store.multi_get(hashes) if hashes else []))
+        children = []
+        for i, ref in refs:
+            if isinstance(ref, list):
+                children.append((i, ref, encode_node(ref), None))
+            else:
+                if rlp_nodes[ref] is None:
+                    raise Exception("Node %s is missing" % ref.hex())
+                children.append((i, decode_node(rlp_nodes[ref]), rlp_nodes[ref], ref))
+        return [node, rlp_node, hash_key, children, {}, slot]
+
+    def _write_record(self, node, rlp_node, hash_key, offsets: dict) -> int:
+        node_type = get_node_type(node)
+        slots = 16 if node_type == BRANCH else 1 if node_type == EXTENSION else 0
+        record = RECORD.pack(node_type, hash_key is not None, len(rlp_node))
+        record += b"".join(OFFSET.pack(offsets.get(i, 0)) for i in range(slots))
+        offset = self.offset
+        self.fileobj.write(record + rlp_node)
+        self.offset += len(record) + len(rlp_node)
+        self.nodes += 1
+        return offset
+
+
+class FrozenTrie:
+    def __init__(self, filename: str):
+        """
+        Read-only trie in a file written by freeze. The file is memory mapped, so lookups follow the offsets of the
+        records in the page cache, which is shared by all processes serving the same file. Only the rlp of the nodes
+        which are needed for a result is decoded.
+
+        :param filename: Path of the frozen trie file
+        """
+        self._file = open(filename, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._root_offset, self.root_hash = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception("Not a frozen trie file")
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_value(self, key: bytes) -> bytes:
+        """
+        Takes a key and returns the value stored under that key
+
+        :param key: bytes with length <= 32
+        :return: The value, or empty bytes if there is no value
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        node = self._walk(key, None)
+        if node is None:
+            return BLANK_NODE
+        node_type, rlp_node, _ = node
+        decoded = decode_node(rlp_node)
+        return decoded[16] if node_type == BRANCH else decoded[1]
+
+    def get_proof(self, key: bytes) -> list:
+        """
+        Like Trie.get_proof, the proof can be checked with proof.verify_proof
+
+        :param key: bytes with length <= 32
+        :return: List of rlp encoded nodes, starting with the root node
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        if self._root_offset == 0:
+            return [encode_node(BLANK_NODE)]
+        proof = []
+        self._walk(key, proof)
+        return proof
+
+    def _record(self, offset: int) -> (int, bool, int, int, int):
+        """
+        :param offset: Offset of a record
+        :return: Node type, whether the node is hashed, offset of the child offsets, start and end of the rlp encoding
+        """
+        node_type, hashed, length = RECORD.unpack_from(self._mm, offset)
+        start = offset + RECORD.size
+        slots = 16 if node_type == BRANCH else 1 if node_type == EXTENSION else 0
+        rlp_start = start + slots * OFFSET.size
+        return node_type, hashed, start, rlp_start, rlp_start + length
+
+    def _walk(self, key: bytes, proof: list):
+        """
+        Follows the path of the key
+
+        :param key: bytes with length <= 32
+        :param proof: List the rlp of the hashed nodes on the path is appended to, or None
+        :return: (node type, rlp, offset) of the leaf or branch node which holds the value, None if the key is absent
+        """
+        offset = self._root_offset
+        key_end = len(key) * 2
+        pos = 0
+        while offset:
+            node_type, hashed, start, rlp_start, rlp_end = self._record(offset)
+            if proof is not None and hashed:
+                proof.append(self._mm[rlp_start:rlp_end])
+
+            if node_type == BRANCH:
+                if pos == key_end:
+                    return node_type, self._mm[rlp_start:rlp_end], offset
+                (offset,) = OFFSET.unpack_from(
+                    self._mm, start + nibble_at(key, pos) * OFFSET.size
+                )
+                pos += 1
+                continue
+
+            # the path is the first item of the rlp list, it is decoded without the rest of the node
+            path = self._first_item(rlp_start)
+            curr_start, curr_end = path_range(path)
+            curr_length = curr_end - curr_start
+            if (
+                common_prefix_length(path, curr_start, curr_end, key, pos, key_end)
+                < curr_length
+            ):
+                return None
+
+            if node_type == LEAF:
+                if key_end - pos != curr_length:
+                    return None
+                return node_type, self._mm[rlp_start:rlp_end], offset
+
+            (offset,) = OFFSET.unpack_from(self._mm, start)
+            pos += curr_length
+        return None
+
+    def _first_item(self, rlp_start: int) -> bytes:
+        """
+        :param rlp_start: Offset of the rlp encoding of a leaf or extension node
+        :return: The first item of the node, which is its packed path
+        """
+        prefix = self._mm[rlp_start]
+        # the list header of a leaf or extension node
+        pos = rlp_start + 1 + (prefix - 0xF7 if prefix > 0xF7 else 0)
+        prefix = self._mm[pos]
+        if prefix < 0x80:
+            return self._mm[pos : pos + 1]
+        # a packed path is at most 33 bytes long
+        return self._mm[pos + 1 : pos + 1 + prefix - 0x80]
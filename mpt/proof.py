@@ -0,0 +1,331 @@
+import rlp
+from mpt import db, utils
+from mpt.builder import TrieBuilder
+from mpt.codec import decode_node
+from mpt.trie import (
+    BLANK,
+    BLANK_NODE,
+    BRANCH,
+    LEAF,
+    Trie,
+    bin_to_nibbles,
+    common_prefix_length,
+    get_node_type,
+    lookup_many,
+    nibble_at,
+    path_range,
+    unpack_to_nibbles,
+)
+
+
+class ProofError(Exception):
+    """
+    Raised if a proof does not contain the nodes which are needed to verify it against the root hash
+    """
+
+
+def verify_proof(root_hash: bytes, key: bytes, proof: list) -> bytes:
+    """
+    Verifies a proof created by Trie.get_proof without a database. Nodes are looked up by the hash of their raw
+    bytes, so nothing has to be encoded again.
+
+    :param root_hash: Root hash the proof is checked against
+    :param key: bytes with length <= 32
+    :param proof: List of rlp encoded nodes
+    :return: The value stored under the key, or empty bytes if the proof shows that the key does not exist
+    """
+    return lookup(proof_nodes(proof), root_hash, key)
+
+
+def verify_multiproof(root_hash: bytes, keys: list, proof: list) -> list:
+    """
+    Verifies a proof created by Trie.get_multiproof for all keys in one pass over the trie
+
+    :param root_hash: Root hash the proof is checked against
+    :param keys: List of keys, bytes with length <= 32
+    :param proof: List of rlp encoded nodes
+    :return: List with the value (or empty bytes for an absent key) of every key, in the order of the keys
+    """
+    for key in keys:
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+    nodes = proof_nodes(proof)
+    values = lookup_many(
+        resolve(nodes, root_hash),
+        keys,
+        lambda refs: [resolve(nodes, ref) for ref in refs],
+    )
+    return [values[key] for key in keys]
+
+
+def verify_range_proof(
+    root_hash: bytes, start: bytes, keys: list, values: list, proof: list
+) -> bool:
+    """
+    Verifies a slice of key/value pairs created by Trie.get_range. The trie is rebuilt from the proofs of the first
+    and last key, everything between these two paths is removed and replaced by the given pairs. The root hash only
+    matches if the slice contains all pairs of the range. Like in the trie, a key may have an empty value.
+
+    :param root_hash: Root hash the range is checked against
+    :param start: First key of the requested range
+    :param keys: Keys of the range in ascending order
+    :param values: Values of the keys
+    :param proof: List of rlp encoded nodes. If it is empty, the pairs have to be the whole trie.
+    :return: True if the trie contains more keys after the last key of the range
+    """
+    if len(keys) != len(values):
+        raise Exception("Keys and values must have the same length")
+
+    for i, key in enumerate(keys):
+        if not isinstance(key, bytes) or not isinstance(values[i], bytes):
+            raise Exception("Keys and values must be of type bytes")
+        if key < start or (i and key <= keys[i - 1]):
+            raise ProofError("Keys are not in ascending order")
+
+    if not proof:
+        if TrieBuilder(db.MemoryDB()).build(zip(keys, values)) != root_hash:
+            raise ProofError("Range does not match the root hash")
+        return False
+
+    nodes = proof_nodes(proof)
+    if not keys:
+        # the proof has to show that there is no key at or after start
+        if lookup(nodes, root_hash, start) != BLANK_NODE or has_right_elements(
+            nodes, root_hash, start
+        ):
+            raise ProofError("Range is missing keys")
+        return False
+
+    store = db.MemoryDB()
+    store.write_batch(nodes.items())
+    trie = Trie(store)
+    trie.root_node = _unset_range(
+        trie,
+        nodes,
+        resolve(nodes, root_hash),
+        0,
+        bytes(bin_to_nibbles(start)),
+        bytes(bin_to_nibbles(keys[-1])),
+    )
+    try:
+        for key, value in zip(keys, values):
+            trie.update(key, value)
+    except rlp.DecodingError:
+        raise ProofError("Proof is missing nodes of the range")
+    if trie.get_root_hash() != root_hash:
+        raise ProofError("Range does not match the root hash")
+    return has_right_elements(nodes, root_hash, keys[-1])
+
+
+def has_right_elements(nodes: dict, root_hash: bytes, key: bytes) -> bool:
+    """
+    Checks whether the trie contains any key which is greater than the given one
+
+    :param nodes: Dict which maps hashes to rlp encoded nodes, it must contain the proof of the key
+    :param root_hash: Hash of the root node
+    :param key: bytes with length <= 32
+    :return: True if there is a greater key
+    """
+    edge = bytes(bin_to_nibbles(key))
+    node = resolve(nodes, root_hash)
+    pos = 0
+    while True:
+        node_type = get_node_type(node)
+        if node_type == BLANK:
+            return False
+
+        if node_type == BRANCH:
+            first = edge[pos] + 1 if pos < len(edge) else 0
+            if any(node[i] != BLANK_NODE for i in range(first, 16)):
+                return True
+            if pos == len(edge):
+                return False
+            node = resolve(nodes, node[edge[pos]])
+            pos += 1
+            continue
+
+        path = bytes(unpack_to_nibbles(node[0]))
+        order = _compare_path(path, edge[pos:], node_type == LEAF)
+        if order != 0:
+            return order > 0
+        if node_type == LEAF:
+            return False
+        node = resolve(nodes, node[1])
+        pos += len(path)
+
+
+def _compare_path(path: bytes, edge: bytes, leaf: bool) -> int:
+    """
+    Compares the keys below a leaf or extension node with an edge key of a range
+
+    :param path: Nibbles of the path of the node
+    :param edge: Remaining nibbles of the edge key, starting at the node
+    :param leaf: True for a leaf node
+    :return: -1 if all keys are smaller, 1 if all keys are greater, 0 if the leaf has the edge key or the edge key
+             continues below the extension node
+    """
+    n = min(len(path), len(edge))
+    if path[:n] != edge[:n]:
+        return -1 if path[:n] < edge[:n] else 1
+    if len(path) > len(edge):
+        return 1
+    if leaf and len(path) < len(edge):
+        return -1
+    return 0
+
+
+def _unset_range(
+    trie: Trie, nodes: dict, node: list, pos: int, left: bytes, right: bytes
+) -> list:
+    """
+    Removes everything between the left and the right edge from the subtree of a node. Subtrees outside the range
+    are kept as they are, subtrees on an edge are followed.
+
+    :param trie: Trie which stores the new nodes
+    :param nodes: Dict which maps hashes to rlp encoded nodes
+    :param node: The node of the subtree
+    :param pos: Position of the nibble after the path to the node
+    :param left: Nibbles of the left edge, None if the subtree is completely right of it
+    :param right: Nibbles of the right edge, None if the subtree is completely left of it
+    :return: The new node
+    """
+    node_type = get_node_type(node)
+    if node_type == BLANK:
+        return BLANK_NODE
+
+    if node_type == BRANCH:
+        node = node[:]
+        # the key of the value is the path itself, so it is at least the left edge if that ends here
+        children_right_of_left = left is None or len(left) == pos
+        children_right_of_right = right is not None and len(right) == pos
+        if children_right_of_left:
+            node[16] = BLANK_NODE
+        for i in range(16):
+            if node[i] == BLANK_NODE or children_right_of_right:
+                continue
+            if children_right_of_left or i > left[pos]:
+                child_left = None
+            elif i == left[pos]:
+                child_left = left
+            else:
+                continue
+            if right is None or i < right[pos]:
+                child_right = None
+            elif i == right[pos]:
+                child_right = right
+            else:
+                continue
+            if child_left is None and child_right is None:
+                node[i] = BLANK_NODE
+            else:
+                node[i], db_touch = trie._encode_node(
+                    _unset_range(
+                        trie,
+                        nodes,
+                        resolve(nodes, node[i]),
+                        pos + 1,
+                        child_left,
+                        child_right,
+                    )
+                )
+        return node
+
+    path = bytes(unpack_to_nibbles(node[0]))
+    leaf = node_type == LEAF
+    if left is not None:
+        order = _compare_path(path, left[pos:], leaf)
+        if order < 0:
+            return node
+        if order > 0 or leaf:
+            left = None
+    if right is not None:
+        order = _compare_path(path, right[pos:], leaf)
+        if order > 0:
+            return node
+        if order < 0 or leaf:
+            right = None
+    if left is None and right is None:
+        return BLANK_NODE
+
+    child = _unset_range(
+        trie, nodes, resolve(nodes, node[1]), pos + len(path), left, right
+    )
+    n, db_touch = trie._encode_node(child)
+    return [node[0], n]
+
+
+def proof_nodes(proof: list) -> dict:
+    """
+    :param proof: List of rlp encoded nodes
+    :return: Dict which maps the hash of every node to the node
+    """
+    return {utils.sha3(node): node for node in proof}
+
+
+def resolve(nodes: dict, ref) -> list:
+    """
+    Decodes a reference to a node: a hash which has to be part of the proof, an inline node or the blank node
+
+    :param nodes: Dict which maps hashes to rlp encoded nodes
+    :param ref: Reference to the node
+    :return: Decoded node
+    """
+    if isinstance(ref, list) or ref == BLANK_NODE:
+        return ref
+    rlp_node = nodes.get(ref)
+    if rlp_node is None:
+        raise ProofError("Node %s is missing in the proof" % ref.hex())
+    return decode_node(rlp_node)
+
+
+def lookup(nodes: dict, root_hash: bytes, key: bytes) -> bytes:
+    """
+    Follows the path of the key through the given nodes
+
+    :param nodes: Dict which maps hashes to rlp encoded nodes
+    :param root_hash: Hash of the root node
+    :param key: bytes with length <= 32
+    :return: The value stored under the key, or empty bytes if the key does not exist
+    """
+    if not isinstance(key, bytes):
+        raise Exception("Key must be of type bytes")
+
+    if len(key) > 32:
+        raise Exception("Max key length is 32")
+
+    node = resolve(nodes, root_hash)
+    key_end = len(key) * 2
+    pos = 0
+    while True:
+        node_type = get_node_type(node)
+        if node_type == BLANK:
+            return BLANK_NODE
+
+        if node_type == -1:
+            raise ProofError("Invalid node in proof")
+
+        if node_type == BRANCH:
+            if pos == key_end:
+                return node[16]
+            node = resolve(nodes, node[nibble_at(key, pos)])
+            pos += 1
+            continue
+
+        curr_start, curr_end = path_range(node[0])
+        curr_length = curr_end - curr_start
+        if (
+            common_prefix_length(node[0], curr_start, curr_end, key, pos, key_end)
+            < curr_length
+        ):
+            # the path of the key leaves the trie
+            return BLANK_NODE
+
+        if node_type == LEAF:
+            return node[1] if key_end - pos == curr_length else BLANK_NODE
+
+        node = resolve(nodes, node[1])
+        pos += curr_length
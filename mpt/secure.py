@@ -0,0 +1,154 @@
+import copy
+
+from mpt import utils
+from mpt.cache import LRUCache
+from mpt.trie import BLANK_ROOT, Trie
+
+# prefix of the db entries which map the hash of a key to the key itself
+PREIMAGE_PREFIX = b"secure-key-"
+
+
+class SecureTrie:
+    def __init__(
+        self,
+        path,
+        root_hash: str = BLANK_ROOT,
+        preimages: bool = False,
+        key_cache_size: int = 1024,
+        **kwargs
+    ):
+        """
+        Trie which stores every value under the keccak hash of its key, like the state trie of Ethereum
+
+        :param path (str or db.BaseDB): Path where to store the LevelDB database, or a storage backend instance
+        :param root_hash (str): Root hash of the trie
+        :param preimages (bool): If True, the original keys are stored as well, which is needed for items()
+        :param key_cache_size (int): Number of recently hashed keys which are kept, 0 disables the cache
+        :param kwargs: Further arguments of Trie, e.g. write_back or cache_size
+        """
+        self.trie = Trie(path, root_hash, **kwargs)
+        self.preimages = preimages
+        self.key_cache = LRUCache(key_cache_size) if key_cache_size else None
+
+    @property
+    def root_hash(self):
+        return self.trie.root_hash
+
+    def hash_key(self, key: bytes) -> bytes:
+        """
+        Returns the keccak hash of a key, recently used keys are taken from the cache
+
+        :param key: The original key
+        :return: The key which is used in the trie
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if self.key_cache is None:
+            return utils.keccak_hash(key)
+        hashed = self.key_cache.get(key)
+        if hashed is None:
+            hashed = utils.keccak_hash(key)
+            self.key_cache.put(key, hashed, 1)
+        return hashed
+
+    def update(self, key: bytes, value: bytes) -> None:
+        """
+        Stores the value under the hash of the key, an empty value deletes the key
+
+        :param key: The original key, bytes of any length
+        :param value: bytes
+        """
+        self._update(self.hash_key(key), key, value)
+
+    def update_many(self, items) -> None:
+        """
+        Stores several key/value pairs, all keys are hashed in one pass before the trie is updated
+
+        :param items: Iterable of (key, value) pairs
+        """
+        items = [(self.hash_key(key), key, value) for key, value in items]
+        for hashed, key, value in items:
+            self._update(hashed, key, value)
+
+    def _update(self, hashed: bytes, key: bytes, value: bytes) -> None:
+        if not value:
+            self.trie.delete(hashed)
+            return
+        self.trie.update(hashed, value)
+        if self.preimages:
+            self.trie.put_entry(PREIMAGE_PREFIX + hashed, key)
+
+    def get_value(self, key: bytes) -> bytes:
+        """
+        :param key: The original key
+        :return: The value stored under the key
+        """
+        return self.trie.get_value(self.hash_key(key))
+
+    def get_many(self, keys: list) -> list:
+        """
+        :param keys: List of original keys
+        :return: List with the values of the keys in the same order
+        """
+        return self.trie.get_many([self.hash_key(key) for key in keys])
+
+    def delete(self, key: bytes) -> None:
+        """
+        Deletes the value stored under the key. The preimage is kept, since other roots might still contain the key.
+
+        :param key: The original key
+        """
+        self.trie.delete(self.hash_key(key))
+
+    def get_preimage(self, hashed: bytes) -> bytes:
+        """
+        :param hashed: Hash of a key
+        :return: The original key, or None if it is unknown
+        """
+        return self.trie.get_entry(PREIMAGE_PREFIX + hashed)
+
+    def items(self, *args, **kwargs):
+        """
+        Yields all (key, value) pairs with their original keys, in the order of the hashed keys. Takes the same
+        arguments as Trie.items, which refer to the hashed keys.
+        """
+        if not self.preimages:
+            raise Exception("Preimages are needed to recover the original keys")
+        for hashed, value in self.trie.items(*args, **kwargs):
+            yield self.get_preimage(hashed), value
+
+    def get_proof(self, key: bytes) -> list:
+        """
+        Returns the proof of the key, it has to be verified against the hash of the key
+
+        :param key: The original key
+        :return: List of rlp encoded nodes
+        """
+        return self.trie.get_proof(self.hash_key(key))
+
+    def fork(self) -> "SecureTrie":
+        """
+        :return: An independent secure trie at the current state, see Trie.fork
+        """
+        forked = copy.copy(self)
+        forked.trie = self.trie.fork()
+        return forked
+
+    def snapshot(self) -> int:
+        return self.trie.snapshot()
+
+    def revert(self, snapshot_id: int) -> None:
+        self.trie.revert(snapshot_id)
+
+    def discard(self, snapshot_id: int) -> None:
+        self.trie.discard(snapshot_id)
+
+    def set_root_node(self, root_hash) -> None:
+        self.trie.set_root_node(root_hash)
+
+    def get_root_hash(self) -> bytes:
+        return self.trie.get_root_hash()
+
+    def commit(self):
+        return self.trie.commit()
@@ -0,0 +1,231 @@
+from collections import Counter
+
+from mpt import db, utils
+from mpt.codec import decode_node
+from mpt.trie import CommitStats, Trie
+
+# start of a snapshot, followed by the root hash
+MAGIC = b"MPTSNAP1"
+# length prefix which ends the node records
+END_OF_NODES = 0
+
+
+class SnapshotError(Exception):
+    """
+    Raised if a snapshot is malformed or contains a node which does not belong to the trie
+    """
+
+
+def _write_varint(fileobj, value: int) -> int:
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            break
+    fileobj.write(data)
+    return len(data)
+
+
+def _read_varint(fileobj) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = fileobj.read(1)
+        if not byte:
+            raise SnapshotError("Snapshot is truncated")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def _read_exactly(fileobj, size: int) -> bytes:
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise SnapshotError("Snapshot is truncated")
+    return data
+
+
+def _hashed_children(node: list) -> list:
+    """
+    :param node: Decoded node
+    :return: Hashes of the children which are stored on their own, including those below inline nodes
+    """
+    hashes = []
+    stack = [node]
+    while stack:
+        for ref in Trie._child_refs(stack.pop()):
+            if isinstance(ref, list):
+                stack.append(ref)
+            else:
+                hashes.append(ref)
+    return hashes
+
+
+def export_snapshot(
+    path, root_hash: bytes, fileobj, index: bool = False
+) -> CommitStats:
+    """
+    Writes all nodes which are reachable from the root to a file, in depth first order. Every node is written as its
+    length (varint) followed by its rlp encoding, the hash is not stored since it is implied. The nodes are followed
+    by a zero length and, optionally, an index of the offsets of the nodes.
+
+    Memory is bounded by the depth of the trie: only the children of the nodes on the current path are kept. Subtrees
+    which are referenced several times are written several times, unless an index is requested.
+
+    :param path (str or db.BaseDB): Path of the LevelDB database, or a storage backend instance
+    :param root_hash: Root hash of the trie
+    :param fileobj: Binary file object to write to
+    :param index: If True, a footer with (hash, offset) of every node is written. It needs memory per node.
+    :return: Number of nodes and bytes of nodes which have been written
+    """
+    store = path if isinstance(path, db.BaseDB) else db.DB(path)
+    rlp_root = store.get(root_hash)
+    if rlp_root is None:
+        raise SnapshotError("Root node %s is missing" % root_hash.hex())
+
+    fileobj.write(MAGIC + root_hash)
+    offset = len(MAGIC) + len(root_hash)
+    offsets = {} if index else None
+    nodes = 0
+    size = 0
+    # (hash, rlp encoded node), the next node in depth first order is on top
+    stack = [(root_hash, rlp_root)]
+    while stack:
+        hash_key, rlp_node = stack.pop()
+        if offsets is not None:
+            if hash_key in offsets:
+                continue
+            offsets[hash_key] = offset
+        offset += _write_varint(fileobj, len(rlp_node))
+        fileobj.write(rlp_node)
+        offset += len(rlp_node)
+        nodes += 1
+        size += len(rlp_node)
+
+        children = _hashed_children(decode_node(rlp_node))
+        if children:
+            rlp_children = store.multi_get(children)
+            for child, rlp_child in zip(children, rlp_children):
+                if rlp_child is None:
+                    raise SnapshotError("Node %s is missing" % child.hex())
+            stack.extend(reversed(list(zip(children, rlp_children))))
+    offset += _write_varint(fileobj, END_OF_NODES)
+
+    if offsets is not None:
+        for hash_key in sorted(offsets):
+            fileobj.write(hash_key + offsets[hash_key].to_bytes(8, "big"))
+        fileobj.write(offset.to_bytes(8, "big") + len(offsets).to_bytes(8, "big"))
+    return CommitStats(nodes, size)
+
+
+def import_snapshot(path, fileobj, batch_size: int = 10000) -> bytes:
+    """
+    Reads a snapshot written by export_snapshot and stores its nodes. Every node is checked against the hashes which
+    have been announced by the nodes before it, so a node which does not belong to the trie is rejected as soon as
+    it is read. Like in TrieSync, a node is only written once its whole subtree is stored, so a truncated or corrupt
+    snapshot leaves complete subtrees behind and the import (or a sync) can simply be started again. Nodes are
+    written in batches and memory is bounded by the depth of the trie.
+
+    :param path (str or db.BaseDB): Path where to store the LevelDB database, or a storage backend instance
+    :param fileobj: Binary file object to read from
+    :param batch_size: Number of nodes which are written in one batch
+    :return: Root hash of the imported trie
+    """
+    store = path if isinstance(path, db.BaseDB) else db.DB(path)
+    if _read_exactly(fileobj, len(MAGIC)) != MAGIC:
+        raise SnapshotError("Not a trie snapshot")
+    root_hash = _read_exactly(fileobj, 32)
+
+    # hashes which are referenced by imported nodes but have not been read yet
+    expected = Counter([root_hash])
+    # hash -> [rlp encoded node, number of children which are not complete yet] of the nodes on the current path
+    incomplete = {}
+    # hash of a child which is not complete yet -> hashes of the incomplete nodes waiting for it
+    waiting = {}
+    # complete nodes which are waiting for the next write
+    batch = {}
+
+    def complete(hash_key: bytes) -> None:
+        stack = [hash_key]
+        while stack:
+            hash_key = stack.pop()
+            batch[hash_key] = incomplete.pop(hash_key)[0]
+            for parent in waiting.pop(hash_key, ()):
+                incomplete[parent][1] -= 1
+                if incomplete[parent][1] == 0:
+                    stack.append(parent)
+
+    while True:
+        length = _read_varint(fileobj)
+        if length == END_OF_NODES:
+            break
+        rlp_node = _read_exactly(fileobj, length)
+        hash_key = utils.sha3(rlp_node)
+        if not expected[hash_key]:
+            raise SnapshotError("Node %s is not part of the trie" % hash_key.hex())
+        expected[hash_key] -= 1
+        if not expected[hash_key]:
+            del expected[hash_key]
+        children = _hashed_children(decode_node(rlp_node))
+        expected.update(children)
+
+        # a subtree which is referenced several times is complete after its first copy
+        if hash_key in batch or store.get(hash_key) is not None:
+            continue
+        incomplete[hash_key] = [rlp_node, 0]
+        unknown = [child for child in children if child not in batch]
+        stored = store.multi_get(unknown) if unknown else []
+        for child, data in zip(unknown, stored):
+            if data is None:
+                waiting.setdefault(child, []).append(hash_key)
+                incomplete[hash_key][1] += 1
+        if incomplete[hash_key][1] == 0:
+            complete(hash_key)
+
+        if len(batch) >= batch_size:
+            store.write_batch(list(batch.items()))
+            batch.clear()
+
+    if batch:
+        store.write_batch(list(batch.items()))
+    if incomplete:
+        raise SnapshotError("Snapshot is missing %d nodes" % len(waiting))
+    # with an index, a subtree which is referenced several times has only been written once
+    missing = [hash_key for hash_key in expected if store.get(hash_key) is None]
+    if missing:
+        raise SnapshotError("Snapshot is missing %d nodes" % len(missing))
+    return root_hash
+
+
+def read_index(fileobj) -> dict:
+    """
+    Reads the index footer of a snapshot
+
+    :param fileobj: Seekable binary file object of a snapshot which has been exported with an index
+    :return: Dict which maps the hash of every node to the offset of its record
+    """
+    fileobj.seek(-16, 2)
+    trailer = _read_exactly(fileobj, 16)
+    index_offset = int.from_bytes(trailer[:8], "big")
+    count = int.from_bytes(trailer[8:], "big")
+    fileobj.seek(index_offset)
+    index = {}
+    for _ in range(count):
+        entry = _read_exactly(fileobj, 40)
+        index[entry[:32]] = int.from_bytes(entry[32:], "big")
+    return index
+
+
+def read_node(fileobj, offset: int) -> bytes:
+    """
+    :param fileobj: Seekable binary file object of a snapshot
+    :param offset: Offset of a node record, as given by the index
+    :return: The rlp encoded node
+    """
+    fileobj.seek(offset)
+    return _read_exactly(fileobj, _read_varint(fileobj))
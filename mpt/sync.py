@@ -0,0 +1,212 @@
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from mpt import db, utils
+from mpt.codec import decode_node
+from mpt.trie import Trie
+
+# progress of a sync: nodes and bytes written, fetch requests sent, responses which did not match their hash,
+# hashes waiting to be requested, requests in flight, seconds since the start and written nodes per second
+SyncStats = namedtuple(
+    "SyncStats",
+    [
+        "nodes",
+        "bytes",
+        "requests",
+        "invalid",
+        "queued",
+        "in_flight",
+        "elapsed",
+        "nodes_per_second",
+    ],
+)
+
+
+def db_source(store: db.BaseDB):
+    """
+    Returns a node source which serves nodes from a local store, e.g. as a stand-in for a peer
+
+    :param store: Backend which contains the nodes
+    :return: Callable which maps a list of hashes to a list of rlp encoded nodes (None if unknown)
+    """
+    return store.multi_get
+
+
+class _Request:
+    __slots__ = ("hash_key", "rlp_node", "deps", "parents", "retries")
+
+    def __init__(self, hash_key: bytes, parent):
+        self.hash_key = hash_key
+        self.rlp_node = None
+        # number of children which are not stored yet
+        self.deps = 0
+        self.parents = [parent] if parent is not None else []
+        self.retries = 0
+
+
+class TrieSync:
+    def __init__(
+        self,
+        path,
+        root_hash: bytes,
+        fetch,
+        batch_size: int = 384,
+        max_in_flight: int = 4,
+        write_batch_size: int = 10000,
+        max_retries: int = 3,
+    ):
+        """
+        Fills a local store with all nodes of a trie, starting from nothing but its root hash. Nodes are fetched in
+        batches by hash, several batches can be in flight. A node is only written once all nodes below it have been
+        written, so a node in the store always has its complete subtree and an interrupted sync can simply be
+        started again.
+
+        :param path (str or db.BaseDB): Path where to store the LevelDB database, or a storage backend instance
+        :param root_hash: Hash of the root node of the trie
+        :param fetch: Callable which takes a list of hashes and returns a list with the rlp encoded nodes in the same
+                      order, None for unknown nodes. It is called from worker threads.
+        :param batch_size: Maximum number of hashes per fetch call
+        :param max_in_flight: Maximum number of fetch calls at the same time
+        :param write_batch_size: Number of completed nodes which are written in one batch
+        :param max_retries: Number of times a node is requested again after an invalid or missing response
+        """
+        self.db = path if isinstance(path, db.BaseDB) else db.DB(path)
+        self.root_hash = root_hash
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.write_batch_size = write_batch_size
+        self.max_retries = max_retries
+        # hash -> _Request for every node which has not been written yet
+        self._requests = {}
+        self._queue = deque()
+        self._in_flight = {}
+        # completed nodes which are waiting for the next write
+        self._batch = {}
+        self.nodes = 0
+        self.bytes = 0
+        self.requests = 0
+        self.invalid = 0
+        self._start = None
+
+    def run(self) -> SyncStats:
+        """
+        Fetches and writes nodes until the whole trie is stored
+
+        :return: Final statistics of the sync
+        """
+        self._start = time.monotonic()
+        if self.db.get(self.root_hash) is None:
+            self._schedule(self.root_hash, None)
+
+        with ThreadPoolExecutor(self.max_in_flight) as executor:
+            while True:
+                while self._queue and len(self._in_flight) < self.max_in_flight:
+                    hashes = [
+                        self._queue.popleft()
+                        for _ in range(min(self.batch_size, len(self._queue)))
+                    ]
+                    self._in_flight[executor.submit(self.fetch, hashes)] = hashes
+                    self.requests += 1
+                if not self._in_flight:
+                    break
+
+                done, _ = wait(self._in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    hashes = self._in_flight.pop(future)
+                    for hash_key, rlp_node in zip(hashes, future.result()):
+                        self._process(hash_key, rlp_node)
+        self._flush()
+
+        if self._requests:
+            raise Exception("Sync finished with incomplete nodes")
+        return self.stats()
+
+    def stats(self) -> SyncStats:
+        """
+        :return: Current statistics of the sync
+        """
+        elapsed = time.monotonic() - self._start if self._start is not None else 0.0
+        return SyncStats(
+            self.nodes,
+            self.bytes,
+            self.requests,
+            self.invalid,
+            len(self._queue),
+            len(self._in_flight),
+            elapsed,
+            self.nodes / elapsed if elapsed else 0.0,
+        )
+
+    def _schedule(self, hash_key: bytes, parent: _Request) -> None:
+        self._requests[hash_key] = _Request(hash_key, parent)
+        self._queue.append(hash_key)
+
+    def _process(self, hash_key: bytes, rlp_node: bytes) -> None:
+        """
+        Verifies a response and schedules the children of the node which are not stored yet
+
+        :param hash_key: Requested hash
+        :param rlp_node: Response of the node source
+        """
+        request = self._requests[hash_key]
+        if rlp_node is None or utils.sha3(rlp_node) != hash_key:
+            self.invalid += 1
+            request.retries += 1
+            if request.retries > self.max_retries:
+                raise Exception("Node %s could not be fetched" % hash_key.hex())
+            self._queue.append(hash_key)
+            return
+
+        request.rlp_node = rlp_node
+        children = []
+        stack = [decode_node(rlp_node)]
+        while stack:
+            for ref in Trie._child_refs(stack.pop()):
+                if isinstance(ref, list):
+                    # inline nodes are part of their parent, but their children are not
+                    stack.append(ref)
+                else:
+                    children.append(ref)
+
+        unknown = [ref for ref in children if ref not in self._batch]
+        stored = self.db.multi_get(unknown) if unknown else []
+        for ref, data in zip(unknown, stored):
+            if data is not None:
+                continue
+            child = self._requests.get(ref)
+            if child is None:
+                self._schedule(ref, request)
+            else:
+                # the same subtree is referenced several times
+                child.parents.append(request)
+            request.deps += 1
+
+        if request.deps == 0:
+            self._complete(hash_key)
+
+    def _complete(self, hash_key: bytes) -> None:
+        """
+        Marks a node as complete, together with all parents which have no other missing children
+
+        :param hash_key: Hash of a node whose children are all stored
+        """
+        stack = [hash_key]
+        while stack:
+            hash_key = stack.pop()
+            request = self._requests.pop(hash_key)
+            self._batch[hash_key] = request.rlp_node
+            for parent in request.parents:
+                parent.deps -= 1
+                if parent.deps == 0:
+                    stack.append(parent.hash_key)
+        if len(self._batch) >= self.write_batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self.db.write_batch(self._batch.items())
+            self.nodes += len(self._batch)
+            self.bytes += sum(len(data) for data in self._batch.values())
+            self._batch = {}
@@ -1,5 +1,11 @@
-import rlp
+import copy
+import weakref
+from collections import ChainMap, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from mpt import db, utils
+from mpt.cache import LRUCache
+from mpt.codec import decode_node, encode_node
 
 BLANK_ROOT = ""
 BLANK_NODE = b""
@@ -7,6 +13,29 @@ BLANK_NODE = b""
 # node types
 (BLANK, BRANCH, LEAF, EXTENSION) = tuple(range(4))
 
+# hash of the blank root node
+BLANK_ROOT_HASH = utils.sha3(encode_node(BLANK_NODE))
+
+# result of a commit: number of nodes and bytes written to the database
+CommitStats = namedtuple("CommitStats", ["nodes", "bytes"])
+
+# result of get_range: contiguous keys and values plus the proof of the edges of the range
+RangeResult = namedtuple("RangeResult", ["keys", "values", "proof"])
+
+# entries of the flat layer are stored under this prefix plus the key of the value
+FLAT_PREFIX = b"flat:"
+# root hash the flat layer belongs to, empty while the layer is regenerated
+FLAT_ROOT_KEY = b"flat-root"
+
+# all open tries per database, prune keeps everything which is reachable from their roots
+_open_tries = weakref.WeakKeyDictionary()
+
+# marks a pending entry which did not exist in the undo journal of a snapshot
+_MISSING = object()
+
+# thread pool of prefetch, created on first use
+_prefetch_executor = None
+
 
 def bin_to_nibbles(key: bytes) -> list:
     """
@@ -60,6 +89,16 @@ def unpack_to_nibbles(bin_data: bytes) -> list:
     return o
 
 
+def nibbles_to_bin(nibbles) -> bytes:
+    """
+    Packs an even number of nibbles into bytes, the reverse of bin_to_nibbles
+
+    :param nibbles: Sequence of nibbles
+    :return: The packed bytes
+    """
+    return bytes((nibbles[i] << 4) | nibbles[i + 1] for i in range(0, len(nibbles), 2))
+
+
 def starts_with(full: list, part: list) -> bool:
     """
     test whether the items in the part is the leading items of the full
@@ -73,6 +112,221 @@ def starts_with(full: list, part: list) -> bool:
     return full[: len(part)] == part
 
 
+def nibble_at(data: bytes, i: int) -> int:
+    """
+    Returns the i-th nibble of the given bytes without unpacking them
+
+    :param data: Bytes which are read as a sequence of nibbles
+    :param i: Position of the nibble
+    :return: The nibble
+    """
+    b = data[i >> 1]
+    return b & 0x0F if i & 1 else b >> 4
+
+
+def path_range(bin_data: bytes) -> (int, int):
+    """
+    Returns the nibble range of the path within packed binary data, which skips the flag (and padding) nibble
+
+    :param bin_data: binary packed from nibbles
+    :return: Start and end position of the path nibbles in bin_data
+    """
+    return (1 if bin_data[0] & 0x10 else 2), len(bin_data) * 2
+
+
+def common_prefix_length(
+    a: bytes, a_start: int, a_end: int, b: bytes, b_start: int, b_end: int
+) -> int:
+    """
+    Compares two nibble ranges of two byte strings
+
+    :return: The number of leading nibbles both ranges have in common
+    """
+    length = min(a_end - a_start, b_end - b_start)
+    i = 0
+    while i < length and nibble_at(a, a_start + i) == nibble_at(b, b_start + i):
+        i += 1
+    return i
+
+
+def pack_nibble_range(data: bytes, start: int, end: int, terminator: bool) -> bytes:
+    """
+    Like pack_nibbles, but takes the nibbles start to end of the given bytes
+
+    :param data: Bytes which contain the nibbles
+    :param start: Position of the first nibble
+    :param end: Position after the last nibble
+    :param terminator: True for leaf, False for extension
+    :return: A string which containing of all nibbles
+    """
+    flag = 0x20 if terminator else 0
+    if (end - start) % 2:
+        # odd length, the first nibble is stored next to the flag
+        head = bytes([flag | 0x10 | nibble_at(data, start)])
+        start += 1
+    else:
+        head = bytes([flag])
+    if start % 2 == 0:
+        # the remaining nibbles are aligned to bytes, so we can just slice
+        return head + data[start // 2 : end // 2]
+    return head + bytes(
+        (nibble_at(data, i) << 4) | nibble_at(data, i + 1) for i in range(start, end, 2)
+    )
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError(
+        "Nodes are shared and must not be modified, change a copy (node[:]) instead"
+    )
+
+
+class Node(list):
+    """
+    Node which remembers its hash and whether it has been stored. The rlp encoding is only kept for nodes which are
+    not stored under their hash yet (or are small enough to be inlined), stored nodes do not pay for a second copy of
+    their data. Instances are shared, so they cannot be modified; a copy (node[:]) is a plain list again.
+    """
+
+    __slots__ = ("rlp", "hash", "dirty")
+    node_type = -1
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable
+
+
+class BranchNode(Node):
+    __slots__ = ()
+    node_type = BRANCH
+
+
+class LeafNode(Node):
+    __slots__ = ()
+    node_type = LEAF
+
+
+class ExtensionNode(Node):
+    __slots__ = ()
+    node_type = EXTENSION
+
+
+_NODE_CLASSES = {BRANCH: BranchNode, LEAF: LeafNode, EXTENSION: ExtensionNode}
+
+
+def make_node(
+    node: list, rlp_node: bytes, hash_key: bytes = None, dirty: bool = False
+) -> Node:
+    """
+    Turns a decoded node into an instance of its node class
+
+    :param node: A list which represents a node, it must not be blank
+    :param rlp_node: The rlp encoding of the node. It is dropped if the node is stored under the given hash.
+    :param hash_key: Hash of the rlp encoding, it is computed on demand if it is not given
+    :param dirty: True if the node has not been stored yet
+    :return: The node as BranchNode, LeafNode or ExtensionNode
+    """
+    typed = _NODE_CLASSES[get_node_type(node)](node)
+    if hash_key is not None and not dirty and len(rlp_node) >= 32:
+        rlp_node = None
+    typed.rlp = rlp_node
+    typed.hash = hash_key
+    typed.dirty = dirty
+    return typed
+
+
+def node_hash(node: Node) -> bytes:
+    """
+    :param node: Instance of a node class
+    :return: The hash of the node, which is only computed once
+    """
+    if node.hash is None:
+        node.hash = utils.sha3(node.rlp)
+    return node.hash
+
+
+def get_node_type(node: list) -> int:
+    """
+    Returns the type of the node
+
+    :param node: String or list
+    :return: Node type
+    """
+    if isinstance(node, Node):
+        return node.node_type
+    if node == BLANK_NODE:
+        return BLANK
+    elif len(node) == 2:
+        # check if the terminator is set.
+        return LEAF if node[0][0] & 0x20 else EXTENSION
+    elif len(node) == 17:
+        return BRANCH
+    return -1
+
+
+def lookup_many(root_node: list, keys: list, resolve_many) -> dict:
+    """
+    Looks up several keys at once. The keys are walked down level by level, so every node on a shared path is visited
+    only once, and all child references of a level are resolved with a single call.
+
+    :param root_node: The node where the paths of the keys start
+    :param keys: List of keys in bytes
+    :param resolve_many: Callable which takes a list of child references (hash, inline node or blank node) and
+                         returns the decoded nodes in the same order
+    :return: Dict which maps every key to its value, or to empty bytes if the key does not exist
+    """
+    values = {}
+    # nodes of the current level as (node, position of the next nibble, sorted keys below the node)
+    level = [(root_node, 0, sorted(set(keys)))]
+    while level:
+        refs = []
+        children = []
+        for node, pos, group in level:
+            node_type = get_node_type(node)
+            if node_type == BRANCH:
+                by_nibble = {}
+                for key in group:
+                    if pos == len(key) * 2:
+                        values[key] = node[16]
+                    else:
+                        by_nibble.setdefault(nibble_at(key, pos), []).append(key)
+                for index, sub_group in by_nibble.items():
+                    refs.append(node[index])
+                    children.append((pos + 1, sub_group))
+                continue
+
+            if node_type == BLANK:
+                for key in group:
+                    values[key] = BLANK_NODE
+                continue
+
+            curr_start, curr_end = path_range(node[0])
+            curr_length = curr_end - curr_start
+            matching = []
+            for key in group:
+                key_end = len(key) * 2
+                if (
+                    common_prefix_length(
+                        node[0], curr_start, curr_end, key, pos, key_end
+                    )
+                    < curr_length
+                ):
+                    values[key] = BLANK_NODE
+                elif node_type == LEAF:
+                    values[key] = (
+                        node[1] if key_end - pos == curr_length else BLANK_NODE
+                    )
+                else:
+                    matching.append(key)
+            if matching:
+                refs.append(node[1])
+                children.append((pos + curr_length, matching))
+
+        level = [
+            (child, pos, group)
+            for child, (pos, group) in zip(resolve_many(refs) if refs else [], children)
+        ]
+    return values
+
+
 def is_key_value_type(node_type: int) -> bool:
     """
     The function checks if the given node type is a leaf or extension node
@@ -84,30 +338,64 @@ def is_key_value_type(node_type: int) -> bool:
 
 
 class Trie:
-    def __init__(self, path: str, root_hash: str = BLANK_ROOT):
+    def __init__(
+        self,
+        path,
+        root_hash: str = BLANK_ROOT,
+        write_back: bool = False,
+        cache_size: int = 0,
+        flat: bool = False,
+    ):
         """
         Initializes a new Trie object
 
-        :param path (str): Path where to store the database
+        :param path (str or db.BaseDB): Path where to store the LevelDB database, or a storage backend instance
         :param root_hash (str): Root hash of the trie
+        :param write_back (bool): If True, new nodes are kept in memory until commit() is called
+        :param cache_size (int): Budget in bytes (of encoded nodes) for the cache of decoded nodes, 0 disables it
+        :param flat (bool): If True, values are additionally stored under their plain key, so get_value needs a single
+                            db read while the flat layer belongs to the current root. Changes of the flat layer
+                            are written by the next commit, or get_root_hash while no snapshot is open.
         """
+        self.db = path if isinstance(path, db.BaseDB) else db.DB(path)
+        self.write_back = write_back
+        # hash -> decoded node. Decoded nodes are shared, so they must never be modified in place.
+        self.cache = LRUCache(cache_size) if cache_size else None
+        # hash -> rlp encoded node, for nodes which have not been written to the db yet
+        self._dirty = {}
+        # entries next to the nodes (e.g. key preimages) which are written with the next commit, None deletes.
+        # A ChainMap after a fork, the maps below the first one are shared with forks and never changed.
+        self._pending = {}
+        self.flat = flat
+        # one (root node, flat layer state, previous pending entries) frame per open snapshot
+        self._journal = []
+        # True while the flat layer (db plus pending entries) matches root_node
+        self._flat_valid = False
+        # committed root the flat layer in the db has to belong to, so that the pending entries complete it
+        self._flat_root = None
         self.root_node = None
         self.root_hash = root_hash
         self.set_root_node(root_hash)
-        self.db = db.DB("./testdb")
+        _open_tries.setdefault(self.db, weakref.WeakSet()).add(self)
 
     def set_root_node(self, root_hash: str) -> None:
         """
         Sets the root node
 
-        :param root_hash: String which represents the root hash
+        :param root_hash: String or bytes which represents the root hash
         """
-        assert isinstance(root_hash, str)
+        assert isinstance(root_hash, (str, bytes))
         assert len(root_hash) in [0, 32]
-        if root_hash == BLANK_ROOT:
+        if len(root_hash) == 0:
             self.root_node = BLANK_NODE
         else:
-            self.root_node = db.get(root_hash)
+            self.root_node = self._decode_to_node(root_hash)
+
+        if self.flat:
+            # uncommitted changes of the flat layer belong to the previous root
+            self._invalidate_flat()
+            self._flat_root = root_hash
+            self._flat_valid = self._flat_matches(root_hash)
 
     def update(self, key: bytes, value: bytes) -> None:
         """
@@ -125,7 +413,9 @@ class Trie:
         if not isinstance(value, bytes):
             raise Exception("Value must be bytes")
 
-        self.root_node = self._update(self.root_node, bin_to_nibbles(key), value)
+        self.root_node = self._update(self.root_node, key, 0, value)
+        if self._flat_valid:
+            self._set_pending(FLAT_PREFIX + key, value)
 
     def get_value(self, key: bytes) -> bytes:
         """
@@ -139,160 +429,897 @@ class Trie:
 
         if len(key) > 32:
             raise Exception("Max key length is 32")
-        return self._get_value(self.root_node, bin_to_nibbles(key))
 
-    def _get_value(self, node: bytes, key: list) -> bytes:
+        if self._flat_valid:
+            flat_key = FLAT_PREFIX + key
+            if flat_key in self._pending:
+                value = self._pending[flat_key]
+                return BLANK_NODE if value is None else value
+            # the root marker is read together with the entry, another writer might have moved the layer
+            marker, value = self.db.multi_get([FLAT_ROOT_KEY, flat_key])
+            if self._flat_matches(self._flat_root, marker):
+                return BLANK_NODE if value is None else value
+            self._invalidate_flat()
+        return self._get_value(self.root_node, key, 0)
+
+    def get_many(self, keys: list) -> list:
+        """
+        Returns the values of several keys. The keys are walked down the trie together, so every node on a shared
+        path is decoded once, and the children which are needed on one level are read with one multi_get.
+
+        :param keys: List of keys, bytes with length <= 32
+        :return: List with the value (or empty bytes) of every key in the same order
+        """
+        for key in keys:
+            if not isinstance(key, bytes):
+                raise Exception("Key must be of type bytes")
+
+            if len(key) > 32:
+                raise Exception("Max key length is 32")
+
+        if self._flat_valid:
+            flat_keys = [FLAT_PREFIX + key for key in keys]
+            missing = [key for key in flat_keys if key not in self._pending]
+            stored = {}
+            if missing:
+                data = self.db.multi_get([FLAT_ROOT_KEY] + missing)
+                stored = dict(zip(missing, data[1:]))
+            if not missing or self._flat_matches(self._flat_root, data[0]):
+                values = [
+                    self._pending[key] if key in self._pending else stored[key]
+                    for key in flat_keys
+                ]
+                return [BLANK_NODE if value is None else value for value in values]
+            self._invalidate_flat()
+
+        values = lookup_many(self.root_node, keys, self._resolve_many)
+        return [values[key] for key in keys]
+
+    def prefetch(self, keys: list, executor=None) -> Future:
+        """
+        Reads the nodes on the paths of the given keys into the cache in a background thread, e.g. while the updates
+        for these keys are prepared. The paths are walked like in get_many, so the nodes of one level are read with
+        one multi_get. Updates which run in the meantime are not affected, they read the nodes themselves if they
+        are not cached yet.
+
+        :param keys: List of keys, bytes with length <= 32
+        :param executor: concurrent.futures executor, defaults to a thread pool which is shared by all tries
+        :return: Future which is done once all nodes are cached, its result maps the keys to their values
+        """
+        global _prefetch_executor
+
+        if self.cache is None:
+            raise Exception("Prefetching needs a cache, set cache_size")
+
+        for key in keys:
+            if not isinstance(key, bytes):
+                raise Exception("Key must be of type bytes")
+
+            if len(key) > 32:
+                raise Exception("Max key length is 32")
+
+        if executor is None:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    thread_name_prefix="mpt-prefetch"
+                )
+            executor = _prefetch_executor
+        return executor.submit(
+            lookup_many, self.root_node, list(keys), self._resolve_many
+        )
+
+    def _get_value(self, node: bytes, key: bytes, pos: int) -> bytes:
         """
         Takes a key and returns the value stored under that key. If there is no
         value, empty bytes are returned.
 
-        :param node: List which is used to go down the rabbit hole
-        :param key: List of key nibbles
+        :param node: List where the search starts
+        :param key: The key in bytes
+        :param pos: Position of the next key nibble which has to be matched
+        """
+        key_end = len(key) * 2
+        while True:
+            node_type = self._get_node_type(node)
+            if node_type == BLANK:
+                return BLANK_NODE
+
+            if node_type == BRANCH:
+                if pos == key_end:
+                    return node[-1]
+                node = self._decode_to_node(node[nibble_at(key, pos)])
+                pos += 1
+                continue
+
+            curr_start, curr_end = path_range(node[0])
+            curr_length = curr_end - curr_start
+            # If the key does not match with the given key, we return the blank node
+            if (
+                common_prefix_length(node[0], curr_start, curr_end, key, pos, key_end)
+                < curr_length
+            ):
+                return BLANK_NODE
+
+            if node_type == LEAF:
+                # returning value if key match, otherwise the blank node
+                return node[1] if key_end - pos == curr_length else BLANK_NODE
+
+            node = self._decode_to_node(node[1])
+            pos += curr_length
+
+    def get_proof(self, key: bytes) -> list:
+        """
+        Returns the nodes on the path from the root to the given key. The proof can be checked against the root hash
+        with proof.verify_proof, it proves the value as well as the absence of a key.
+
+        :param key: bytes with length <= 32
+        :return: List of rlp encoded nodes, starting with the root node. Inline nodes are part of their parent.
+        """
+        if not isinstance(key, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(key) > 32:
+            raise Exception("Max key length is 32")
+
+        proof = [self._rlp_root()]
+        key_end = len(key) * 2
+        node = self.root_node
+        pos = 0
+        while True:
+            node_type = self._get_node_type(node)
+            if node_type == BRANCH and pos < key_end:
+                ref = node[nibble_at(key, pos)]
+                pos += 1
+            elif node_type == EXTENSION:
+                curr_start, curr_end = path_range(node[0])
+                if (
+                    common_prefix_length(
+                        node[0], curr_start, curr_end, key, pos, key_end
+                    )
+                    < curr_end - curr_start
+                ):
+                    return proof
+                ref = node[1]
+                pos += curr_end - curr_start
+            else:
+                return proof
+
+            if isinstance(ref, bytes) and len(ref) == 32:
+                proof.append(self._get_rlp(ref))
+            node = self._decode_to_node(ref)
+
+    def get_multiproof(self, keys: list) -> list:
+        """
+        Returns the nodes which are needed to prove the values (or absence) of several keys. Nodes which are shared by
+        the paths of several keys are contained only once.
+
+        :param keys: List of keys, bytes with length <= 32
+        :return: List of distinct rlp encoded nodes, starting with the root node
+        """
+        for key in keys:
+            if not isinstance(key, bytes):
+                raise Exception("Key must be of type bytes")
+
+            if len(key) > 32:
+                raise Exception("Max key length is 32")
+
+        proof = [self._rlp_root()]
+        seen = set()
+
+        def resolve_many(refs: list) -> list:
+            nodes = []
+            for ref in refs:
+                if isinstance(ref, bytes) and len(ref) == 32:
+                    rlp_node = self._get_rlp(ref)
+                    if ref not in seen:
+                        seen.add(ref)
+                        proof.append(rlp_node)
+                    nodes.append(decode_node(rlp_node))
+                else:
+                    nodes.append(self._decode_to_node(ref))
+            return nodes
+
+        lookup_many(self.root_node, keys, resolve_many)
+        return proof
+
+    def items(
+        self,
+        start: bytes = None,
+        end: bytes = None,
+        prefix: bytes = None,
+        read_ahead: bool = False,
+    ):
+        """
+        Yields all (key, value) pairs in ascending key order. The trie is walked depth first and nodes are only
+        decoded when they are reached, so memory is bounded by the depth of the trie. Subtrees outside of the range
+        are skipped without being read.
+
+        :param start: Smallest key to be returned, inclusive
+        :param end: Upper bound of the keys, exclusive
+        :param prefix: Only keys with this prefix are returned
+        :param read_ahead: If True, the children of a branch node are read from the db in one batch
+        """
+        if prefix is not None:
+            start = prefix if start is None else max(start, prefix)
+            upper = db.prefix_upper_bound(prefix)
+            if upper is not None:
+                end = upper if end is None else min(end, upper)
+        start_nibbles = bytes(bin_to_nibbles(start)) if start is not None else None
+        end_nibbles = bytes(bin_to_nibbles(end)) if end is not None else None
+
+        # (node or reference to it, nibbles of the path to the node), the smallest path is on top
+        stack = [(self.root_node, b"")]
+        while stack:
+            ref, path = stack.pop()
+            if end_nibbles is not None:
+                m = min(len(path), len(end_nibbles))
+                if path[:m] > end_nibbles[:m] or (
+                    path[:m] == end_nibbles[:m] and len(path) >= len(end_nibbles)
+                ):
+                    # every key below is greater than end and so is everything left on the stack
+                    return
+            if start_nibbles is not None:
+                m = min(len(path), len(start_nibbles))
+                if path[:m] < start_nibbles[:m]:
+                    # every key below is smaller than start
+                    continue
+
+            node = self._decode_to_node(ref)
+            node_type = self._get_node_type(node)
+            if node_type == BRANCH:
+                children = [
+                    (node[i], path + bytes([i]))
+                    for i in range(15, -1, -1)
+                    if node[i] != BLANK_NODE
+                ]
+                if read_ahead:
+                    resolved = self._resolve_many([child for child, _ in children])
+                    children = [
+                        (child, child_path)
+                        for child, (_, child_path) in zip(resolved, children)
+                    ]
+                stack.extend(children)
+                if node[16] != BLANK_NODE:
+                    key = nibbles_to_bin(path)
+                    if (start is None or key >= start) and (end is None or key < end):
+                        yield key, node[16]
+            elif node_type == EXTENSION:
+                stack.append((node[1], path + bytes(unpack_to_nibbles(node[0]))))
+            elif node_type == LEAF:
+                key = nibbles_to_bin(path + bytes(unpack_to_nibbles(node[0])))
+                if (start is None or key >= start) and (end is None or key < end):
+                    yield key, node[1]
+
+    def get_range(
+        self, start: bytes, max_count: int = None, max_bytes: int = None
+    ) -> RangeResult:
+        """
+        Returns a contiguous slice of key/value pairs, starting at the given key, together with the proofs of its
+        first and last key. proof.verify_range_proof checks the whole slice against the root hash at once.
+
+        :param start: Smallest key of the range, it does not need to exist
+        :param max_count: Maximum number of pairs
+        :param max_bytes: Maximum size of all keys and values. The last pair may exceed it, at least one pair is
+                          returned.
+        :return: Keys, values and proof nodes
+        """
+        if not isinstance(start, bytes):
+            raise Exception("Key must be of type bytes")
+
+        if len(start) > 32:
+            raise Exception("Max key length is 32")
+
+        keys = []
+        values = []
+        size = 0
+        for key, value in self.items(start):
+            if max_count is not None and len(keys) >= max_count:
+                break
+            if max_bytes is not None and keys and size >= max_bytes:
+                break
+            keys.append(key)
+            values.append(value)
+            size += len(key) + len(value)
+
+        edges = [start, keys[-1]] if keys else [start]
+        return RangeResult(keys, values, self.get_multiproof(edges))
+
+    def keys(self, *args, **kwargs):
+        """
+        Yields all keys in ascending order, takes the same arguments as items
+        """
+        for key, _ in self.items(*args, **kwargs):
+            yield key
+
+    def values(self, *args, **kwargs):
+        """
+        Yields all values in the order of their keys, takes the same arguments as items
         """
+        for _, value in self.items(*args, **kwargs):
+            yield value
+
+    def diff(self, root_a, root_b):
+        """
+        Yields the differences between two tries in ascending key order. Both tries are walked at the same time and
+        subtrees which are referenced by the same hash in both are skipped, so the work is proportional to the
+        change and not to the size of the tries.
+
+        :param root_a: Root hash of the old trie, empty for the blank trie
+        :param root_b: Root hash of the new trie, empty for the blank trie
+        :return: Generator of (key, old value, new value), an absent value is empty bytes
+        """
+        # subtrees are given as (reference to a node, number of nibbles of its path which are already consumed)
+        stack = [
+            (
+                (root_a if len(root_a) else BLANK_NODE, 0),
+                (root_b if len(root_b) else BLANK_NODE, 0),
+                b"",
+            )
+        ]
+        while stack:
+            a, b, path = stack.pop()
+            if a == b:
+                continue
+
+            value_a, children_a = self._expand(*a)
+            value_b, children_b = self._expand(*b)
+            if value_a != value_b:
+                yield nibbles_to_bin(path), value_a, value_b
+            for i in range(15, -1, -1):
+                if i in children_a or i in children_b:
+                    stack.append(
+                        (
+                            children_a.get(i, (BLANK_NODE, 0)),
+                            children_b.get(i, (BLANK_NODE, 0)),
+                            path + bytes([i]),
+                        )
+                    )
+
+    def _expand(self, ref, skip: int) -> (bytes, dict):
+        """
+        Looks at a subtree like at a branch node: the value stored at its path and its children by the next nibble
+
+        :param ref: Reference to the node of the subtree (hash, inline node, decoded node or blank node)
+        :param skip: Number of nibbles of the path of a leaf or extension node which are already consumed
+        :return: The value (or empty bytes) and a dict which maps nibbles to subtrees as (reference, skip)
+        """
+        node = self._decode_to_node(ref)
         node_type = self._get_node_type(node)
         if node_type == BLANK:
-            return BLANK_NODE
+            return BLANK_NODE, {}
 
         if node_type == BRANCH:
-            if not key:
-                return node[-1]
-            return self._get_node(self._decode_to_node(node[key[0]]), key[1:])
+            return node[16], {
+                i: (node[i], 0) for i in range(16) if node[i] != BLANK_NODE
+            }
 
+        rest = unpack_to_nibbles(node[0])[skip:]
+        if rest:
+            return BLANK_NODE, {rest[0]: (node, skip + 1)}
         if node_type == LEAF:
-            curr_key = unpack_to_nibbles(node[0])
-            # If the key does not match with the given key, we return None
-            if not starts_with(key, curr_key):
-                return None
-
-            # returning value if key match, otherwise the blank node
-            return node[1] if key == curr_key else BLANK_NODE
-
-        if node_type == EXTENSION:
-            curr_key = unpack_to_nibbles(node[0])
-            # If the key does not match with the given key, we return None
-            if not starts_with(key, curr_key):
-                return None
-            return self._get_node(self._decode_to_node(node[1]), key[len(curr_key) :])
+            return node[1], {}
+        return self._expand(node[1], 0)
 
     def get_root_hash(self) -> bytes:
         """
-        Returns the current hash of the root node
+        Returns the current hash of the root node. In write-back mode the buffered nodes are committed as well, unless
+        snapshots are open: committing would discard them, so only the hash is computed. In write-through mode all
+        other nodes are already stored, so the root node is stored if it has changed, and the hash can be opened with
+        a new Trie right away. Pending changes of the flat layer are written in the same batch as the root while no
+        snapshot is open.
 
         :return: Hash of the root node
         """
-        self.root_hash = utils.sha3(rlp.encode(self.root_node))
+        if not self._journal and (self.write_back or self._pending):
+            self.commit()
+            return self.root_hash
+        self.root_hash = self._hash_root()
+        if (
+            not self.write_back
+            and self.root_node != BLANK_NODE
+            and self.root_node.dirty
+        ):
+            self.db.put(self.root_hash, self.root_node.rlp)
+            self.root_node.dirty = False
         return self.root_hash
 
-    def _update(self, node: list, key: list, value: bytes) -> list:
+    def _hash_root(self) -> bytes:
+        """
+        :return: Hash of the current root node. The encoding is remembered by the node, so an unchanged root is not
+                 encoded again.
         """
-        Recursive called method to update the trie with a new value with a given key
+        if self.root_node == BLANK_NODE:
+            return BLANK_ROOT_HASH
+        return node_hash(self._typed_root())
 
-        :param node: A list on the path for the new value. Used to find the location for the new value
+    def _rlp_root(self) -> bytes:
+        """
+        :return: rlp encoding of the current root node
+        """
+        if self.root_node == BLANK_NODE:
+            return encode_node(BLANK_NODE)
+        root = self._typed_root()
+        return root.rlp if root.rlp is not None else self._get_rlp(root.hash)
+
+    def _typed_root(self) -> Node:
+        """
+        :return: The root node as instance of its node class, it must not be blank
+        """
+        if not isinstance(self.root_node, Node):
+            self.root_node = make_node(
+                self.root_node, encode_node(self.root_node), dirty=True
+            )
+        return self.root_node
+
+    def commit(self) -> CommitStats:
+        """
+        Writes the root node and all buffered nodes which are reachable from it to the database in one batch, together
+        with the pending entries of put_entry. Buffered nodes which have been replaced by later updates are dropped
+        without ever touching the database. Open snapshots are discarded.
+
+        :return: Number of nodes and bytes of nodes which have been written
+        """
+        self.root_hash = self._hash_root()
+        rlp_root = self._rlp_root()
+
+        puts = [(self.root_hash, rlp_root)]
+        # walk down from the root, but only through nodes which are still buffered. Everything below a node that
+        # is already in the db has been committed before.
+        stack = [self.root_node]
+        seen = set()
+        while stack:
+            for ref in self._child_refs(stack.pop()):
+                if isinstance(ref, list):
+                    # inline node, it is part of its parent
+                    stack.append(ref)
+                elif ref in self._dirty and ref not in seen:
+                    seen.add(ref)
+                    puts.append((ref, self._dirty[ref]))
+                    stack.append(self._decode_to_node(ref))
+
+        stats = CommitStats(len(puts), sum(len(data) for _, data in puts))
+        if self._flat_valid and not self._flat_matches(self._flat_root):
+            # another writer has moved the flat layer, the pending entries would only change a part of it
+            self._invalidate_flat()
+        if self._flat_valid:
+            self._pending[FLAT_ROOT_KEY] = self.root_hash
+        deletes = [key for key, data in self._pending.items() if data is None]
+        puts.extend(
+            (key, data) for key, data in self._pending.items() if data is not None
+        )
+
+        self.db.write_batch(puts, deletes)
+        if self.root_node != BLANK_NODE:
+            self.root_node.dirty = False
+        self._dirty = {}
+        self._pending = {}
+        self._journal = []
+        if self.flat:
+            self._flat_root = self.root_hash
+            if not self._flat_valid:
+                # a regeneration of the flat layer might have finished for this root
+                self._flat_valid = self._flat_matches(self.root_hash)
+        return stats
+
+    def fork(self) -> "Trie":
+        """
+        Returns an independent trie at the current state in O(1). Nodes are never modified in place, so the fork
+        shares all nodes, the db and the cache with this trie, and both copy only the nodes along the paths they
+        change. Buffered nodes and pending entries are shared through chains of maps, both tries write their pending
+        entries to a map of their own on top of the shared ones. The flat layer in the db can only belong to one root:
+        once one of the tries commits, the other walks its trie.
+
+        :return: The new trie
+        """
+        forked = copy.copy(self)
+        parent_maps = (
+            self._dirty.maps if isinstance(self._dirty, ChainMap) else [self._dirty]
+        )
+        forked._dirty = ChainMap({}, *parent_maps)
+        shared = (
+            self._pending.maps
+            if isinstance(self._pending, ChainMap)
+            else [self._pending]
+        )
+        self._pending = ChainMap({}, *shared)
+        forked._pending = ChainMap({}, *shared)
+        forked._journal = []
+        _open_tries[self.db].add(forked)
+        return forked
+
+    def snapshot(self) -> int:
+        """
+        Opens a snapshot of the current state, which can be restored with revert. Nodes are never modified in place,
+        so only the root node is remembered, together with the previous values of pending entries which are changed
+        afterwards. Snapshots can be nested, commit discards all of them, while get_root_hash leaves them open and
+        prune keeps the nodes of their roots. Entries which put_entry writes directly in write-through mode are not
+        restored.
+
+        :return: Id of the snapshot
+        """
+        self._journal.append((self.root_node, self._flat_valid, {}))
+        return len(self._journal) - 1
+
+    def revert(self, snapshot_id: int) -> None:
+        """
+        Restores the state at the time of the snapshot and closes it together with all snapshots opened after it
+
+        :param snapshot_id: Id returned by snapshot
+        """
+        if not 0 <= snapshot_id < len(self._journal):
+            raise Exception("Unknown snapshot")
+
+        while len(self._journal) > snapshot_id:
+            root_node, flat_valid, undo = self._journal.pop()
+            for key, data in undo.items():
+                if data is _MISSING:
+                    self._drop_pending(key)
+                else:
+                    self._pending[key] = data
+        self.root_node = root_node
+        self._flat_valid = flat_valid
+
+    def discard(self, snapshot_id: int) -> None:
+        """
+        Keeps all changes and closes the snapshot together with all snapshots opened after it. The changes can still
+        be reverted by an enclosing snapshot.
+
+        :param snapshot_id: Id returned by snapshot
+        """
+        if not 0 <= snapshot_id < len(self._journal):
+            raise Exception("Unknown snapshot")
+
+        frames = self._journal[snapshot_id:]
+        del self._journal[snapshot_id:]
+        if self._journal:
+            parent_undo = self._journal[-1][2]
+            # the oldest previous value of an entry is the one the enclosing snapshot has to restore
+            for _, _, undo in frames:
+                for key, data in undo.items():
+                    parent_undo.setdefault(key, data)
+
+    def _set_pending(self, key: bytes, data) -> None:
+        """
+        Changes a pending entry and records its previous value for the innermost snapshot
+
+        :param key: Key of the entry
+        :param data: New data of the entry, None to delete it from the db, _MISSING to drop the pending entry
+        """
+        if self._journal:
+            undo = self._journal[-1][2]
+            if key not in undo:
+                undo[key] = self._pending.get(key, _MISSING)
+        if data is _MISSING:
+            self._drop_pending(key)
+        else:
+            self._pending[key] = data
+
+    def _drop_pending(self, key: bytes) -> None:
+        """
+        Removes a pending entry. Only the first map of a chain belongs to this trie alone, so an entry in a map which
+        is shared with forks is dropped from a copy of the chain.
+
+        :param key: Key of the entry
+        """
+        if isinstance(self._pending, ChainMap) and any(
+            key in pending for pending in self._pending.maps[1:]
+        ):
+            self._pending = dict(self._pending)
+        self._pending.pop(key, None)
+
+    def regenerate_flat(self, background: bool = False, batch_size: int = 10000):
+        """
+        Rebuilds the flat layer from the trie for the current root. The trie is committed first, afterwards the
+        existing flat entries are compared with the items of the trie in key order and only the differences are
+        written. In the background the trie stays usable, reads walk the trie until the regenerated layer is picked
+        up by the next commit or set_root_node with an unchanged root.
+
+        :param background: If True, the layer is regenerated in a separate thread
+        :param batch_size: Number of changed entries which are written in one batch
+        :return: A Future in the background, otherwise None
+        """
+        if not self.flat:
+            raise Exception("The flat layer is disabled")
+
+        self.commit()
+        root_hash = self.root_hash
+        self._flat_valid = False
+        # the old root marker is removed first, so an interrupted regeneration leaves an invalid layer behind
+        self.db.write_batch([(FLAT_ROOT_KEY, b"")])
+        if not background:
+            self._regenerate_flat(root_hash, batch_size)
+            self._flat_valid = True
+            return None
+
+        executor = ThreadPoolExecutor(1)
+        future = executor.submit(self._regenerate_flat, root_hash, batch_size)
+        executor.shutdown(wait=False)
+        return future
+
+    def _regenerate_flat(self, root_hash: bytes, batch_size: int) -> None:
+        """
+        Brings the flat entries in line with the trie of the given root and marks the layer as belonging to it
+
+        :param root_hash: Committed root the flat layer is generated for
+        :param batch_size: Number of changed entries which are written in one batch
+        """
+        source = Trie(self.db, root_hash)
+        existing = (
+            (key[len(FLAT_PREFIX) :], data)
+            for key, data in self.db.iterate_prefix(FLAT_PREFIX)
+        )
+        puts = []
+        deletes = []
+
+        def flush():
+            self.db.write_batch(puts, deletes)
+            puts.clear()
+            deletes.clear()
+
+        # merge both sorted streams, the flat keys sort like the plain keys since they share the prefix
+        entry = next(existing, None)
+        for key, value in source.items():
+            while entry is not None and entry[0] < key:
+                deletes.append(FLAT_PREFIX + entry[0])
+                entry = next(existing, None)
+            if entry is not None and entry[0] == key:
+                if entry[1] != value:
+                    puts.append((FLAT_PREFIX + key, value))
+                entry = next(existing, None)
+            else:
+                puts.append((FLAT_PREFIX + key, value))
+            if len(puts) + len(deletes) >= batch_size:
+                flush()
+        while entry is not None:
+            deletes.append(FLAT_PREFIX + entry[0])
+            entry = next(existing, None)
+        puts.append((FLAT_ROOT_KEY, root_hash))
+        flush()
+
+    def prune(self, keep_roots=(), batch_size: int = 10000) -> int:
+        """
+        Removes all nodes from the db which are not reachable from a live root (mark and sweep). Live are the given
+        roots and the current roots of all tries which are open on the same db, including their uncommitted nodes, the
+        roots their open snapshots can be reverted to and the roots of AsyncTrie readers on the same backend, so
+        readers can keep using their tries while old roots are pruned. Nodes which are written by another thread or
+        a TrieBuilder during the sweep might be removed as well.
+
+        :param keep_roots: Hashes of further roots whose nodes must be kept
+        :param batch_size: Number of nodes which are deleted in one batch
+        :return: Number of deleted nodes
+        """
+        keep_roots = [root_hash for root_hash in keep_roots if len(root_hash) == 32]
+        marked = set(keep_roots)
+        roots = [(self, self._decode_to_node(root_hash)) for root_hash in keep_roots]
+        for trie in list(_open_tries.get(self.db, ())):
+            if not isinstance(trie, Trie):
+                # readers like AsyncTrie only hold a committed root
+                if len(trie.root_hash) == 32 and trie.root_hash not in marked:
+                    marked.add(trie.root_hash)
+                    roots.append((self, self._decode_to_node(trie.root_hash)))
+                continue
+            roots.append((trie, trie.root_node))
+            marked.add(trie._hash_root())
+            if len(trie.root_hash) == 32:
+                marked.add(trie.root_hash)
+            # root nodes which a revert of an open snapshot restores
+            for root_node, _, _ in trie._journal:
+                if root_node != BLANK_NODE:
+                    roots.append((trie, root_node))
+                    marked.add(
+                        node_hash(root_node)
+                        if isinstance(root_node, Node)
+                        else utils.sha3(encode_node(root_node))
+                    )
+
+        for trie, root_node in roots:
+            # the subtrees of one level are read in one batch, subtrees which are already marked are skipped
+            level = [root_node]
+            while level:
+                refs = []
+                for node in level:
+                    for ref in self._child_refs(node):
+                        if isinstance(ref, list):
+                            # inline nodes are walked as part of the current level
+                            level.append(ref)
+                        elif ref not in marked:
+                            marked.add(ref)
+                            refs.append(ref)
+                level = trie._resolve_many(refs) if refs else []
+
+        deleted = 0
+        deletes = []
+        for key, _ in self.db.iterate_prefix():
+            if len(key) != 32 or key in marked or key.startswith(FLAT_PREFIX):
+                continue
+            deletes.append(key)
+            if len(deletes) >= batch_size:
+                self.db.write_batch((), deletes)
+                deleted += len(deletes)
+                deletes = []
+        if deletes:
+            self.db.write_batch((), deletes)
+            deleted += len(deletes)
+        return deleted
+
+    def _flat_matches(self, root_hash, marker=_MISSING) -> bool:
+        """
+        :param root_hash: Root hash, empty for the blank root
+        :param marker: Root marker of the flat layer if it has already been read from the db
+        :return: True if the flat layer in the db belongs to the given root
+        """
+        if marker is _MISSING:
+            marker = self.db.get(FLAT_ROOT_KEY)
+        if marker is None:
+            # nothing has been stored yet, which is only the flat layer of the blank root
+            return len(root_hash) == 0
+        if len(root_hash) == 0:
+            root_hash = BLANK_ROOT_HASH
+        return marker == root_hash
+
+    def _invalidate_flat(self) -> None:
+        """
+        Stops reading from the flat layer and drops its uncommitted changes
+        """
+        for key in [key for key in self._pending if key.startswith(FLAT_PREFIX)]:
+            self._set_pending(key, _MISSING)
+        self._flat_valid = False
+
+    def _update(self, node: list, key: bytes, pos: int, value: bytes) -> list:
+        """
+        Updates the trie with a new value with a given key. The path down to the node where the value ends up is
+        kept on a stack, afterwards only the nodes on this path are rebuilt and encoded on the way back up.
+
+        :param node: The node where the path for the new value starts
         :param key: Path for the new value
+        :param pos: Position of the next key nibble, the nibbles before are the path to node
         :param value: The value to be stored in the trie
         :return: A new node
         """
-        node_type = self._get_node_type(node)
+        key_end = len(key) * 2
+        # (parent, index) for branch nodes, (parent, None) for extension nodes
+        path = []
+        while True:
+            node_type = self._get_node_type(node)
+            if node_type == BRANCH and pos < key_end:
+                # decode the node at the position of the next nibble in the branch node and go further down the
+                # rabbit whole
+                index = nibble_at(key, pos)
+                path.append((node, index))
+                node = self._decode_to_node(node[index])
+                pos += 1
+            elif node_type == EXTENSION:
+                curr_start, curr_end = path_range(node[0])
+                curr_length = curr_end - curr_start
+                if (
+                    common_prefix_length(
+                        node[0], curr_start, curr_end, key, pos, key_end
+                    )
+                    < curr_length
+                ):
+                    break
+                # the extension key is exhausted, so we continue with the branch node below it
+                path.append((node, None))
+                node = self._decode_to_node(node[1])
+                pos += curr_length
+            else:
+                break
+
+        new_node = self._update_node(node, node_type, key, pos, value)
+
+        while path:
+            parent, index = path.pop()
+            encoded, db_touch = self._encode_node(new_node)
+            if index is None:
+                # the path of the extension node stays the same, only the branch node below has changed
+                new_node = [parent[0], encoded]
+            else:
+                # decoded nodes might be shared with the cache or an older root, so we work on a copy
+                new_node = parent[:]
+                new_node[index] = encoded
+        return new_node
+
+    def _update_node(
+        self, node: list, node_type: int, key: bytes, pos: int, value: bytes
+    ) -> list:
+        """
+        Stores the value in the node where the path for the value ends, or where it leaves the existing paths
+
+        :param node: The last node on the path for the new value
+        :param node_type: The type of the node
+        :param key: Path for the new value
+        :param pos: Position of the next key nibble, the nibbles before are the path to node
+        :param value: The value to be stored in the trie
+        :return: A new node
+        """
+        key_end = len(key) * 2
         # in case the root node is still blank, set it to a leaf node
         if node_type == BLANK:
             # in case the root node is blank, we make it a leaf node
-            return [pack_nibbles(key, True), value]
+            return [pack_nibble_range(key, pos, key_end, True), value]
 
         elif node_type == BRANCH:
-            # key array is empty
-            if not key:
-                # save the value
-                node[-1] = value
-            else:
-                # otherwise decode the node at the position key[0] in the branch node and go further down the
-                # rabbit whole
-                new_node = self._update(
-                    self._decode_to_node(node[key[0]]), key[1:], value
-                )
-                node[key[0]], db_touch = self._encode_node(new_node)
+            # the key is exhausted, so we save the value in a copy of the branch node
+            node = node[:]
+            node[-1] = value
             return node
 
-        elif node_type == LEAF or node_type == EXTENSION:
-            # check if the key length is even
-            even = False if ((ord(node[0][0:1]) & 0x10) == 0x10) else True
-
-            current_key = bin_to_nibbles(node[0])
-            # we remove the encoding according to the parity
-            current_key = current_key[2:] if even else current_key[1:]
+        else:
+            # a leaf node, or an extension node whose key differs from the new one. The path of the node is read
+            # directly from its packed key, the flag nibbles are skipped
+            current_key = node[0]
+            curr_start, curr_end = path_range(current_key)
 
-            prefix = 0
             # compare the keys
-            for i in range(0, min(len(current_key), len(key))):
-                if current_key[i] != key[i]:
-                    break
-                prefix += 1
-
-            remaining_key = key[prefix:]
-            remaining_curr_key = current_key[prefix:]
-
-            if len(remaining_key) == 0 and len(remaining_curr_key) == 0:
-                # both keys are equal and have the same length
-                if node_type == EXTENSION:
-                    # Since we currently have a branch node, we decode the hash to the node and go one level deeper
-                    # to update the value of the branch node
-                    new_node = self._update(
-                        self._decode_to_node(node[1]), remaining_key, value
-                    )
-                else:
-                    # Since we have currently a leaf node, we update the value :)
-                    return [node[0], value]
-            elif len(remaining_curr_key) == 0:
-                # the current key is shorter than the new one and it is exhausted
-                if node_type == EXTENSION:
-                    # we save the old node
-                    old_node = node[:]
-                    # we get the new node
-                    new_node = self._update(
-                        self._decode_to_node(node[1]), remaining_key, value
-                    )
-                    # compare and see if they are equal
-                    if old_node != new_node:
-                        # if not, delete the old node
-                        self._delete_node(old_node)
-                else:
-                    # the old key is exhausted and that's why we make a branch node. There is a value under this path
-                    # and the path is being extended too. That's the reason for a branch node.
-                    new_node = [BLANK_NODE] * 17
-                    # save the value in the branch node
-                    new_node[-1] = node[1]
-                    # create a leaf node with the remaining content
-                    new_node[remaining_key[0]], db_touch = self._encode_node(
-                        [pack_nibbles(remaining_key[1:], True), value]
-                    )
+            prefix = common_prefix_length(
+                current_key, curr_start, curr_end, key, pos, key_end
+            )
+
+            remaining_key = key_end - pos - prefix
+            remaining_curr_key = curr_end - curr_start - prefix
+
+            if remaining_key == 0 and remaining_curr_key == 0:
+                # both keys are equal and have the same length. Since we have currently a leaf node, we update
+                # the value :)
+                return [node[0], value]
+            elif remaining_curr_key == 0:
+                # the current key is shorter than the new one and it is exhausted. The old key of the leaf node is
+                # exhausted and that's why we make a branch node. There is a value under this path and the path is
+                # being extended too. That's the reason for a branch node.
+                new_node = [BLANK_NODE] * 17
+                # save the value in the branch node
+                new_node[-1] = node[1]
+                # create a leaf node with the remaining content
+                new_node[nibble_at(key, pos + prefix)], db_touch = self._encode_node(
+                    [pack_nibble_range(key, pos + prefix + 1, key_end, True), value]
+                )
             else:
                 # both keys have some differences, so we make a branch node
                 new_node = [BLANK_NODE] * 17
 
-                if len(remaining_key) == 0:
+                if remaining_key == 0:
                     # if the remaining key is exhausted, we insert the value into our branch node
                     new_node[-1] = value
                 else:
                     # otherwise we create a leaf node, where the value is stored
-                    new_node[remaining_key[0]], db_touch = self._encode_node(
-                        [pack_nibbles(remaining_key[1:], True), value]
+                    new_node[nibble_at(key, pos + prefix)], db_touch = (
+                        self._encode_node(
+                            [
+                                pack_nibble_range(key, pos + prefix + 1, key_end, True),
+                                value,
+                            ]
+                        )
                     )
 
-                if node_type == EXTENSION and len(remaining_curr_key) == 1:
+                curr_index = nibble_at(current_key, curr_start + prefix)
+                if node_type == EXTENSION and remaining_curr_key == 1:
                     # there is no key left of the extension key, so we set the hash here
-                    new_node[remaining_curr_key[0]] = node[1]
+                    new_node[curr_index] = node[1]
                 else:
                     # set terminator depending on the node type
                     terminator = True if node_type == LEAF else False
                     # saving the old path and value in a new leaf node
-                    new_node[remaining_curr_key[0]], db_touch = self._encode_node(
-                        [pack_nibbles(remaining_curr_key[1:], terminator), node[1]]
+                    new_node[curr_index], db_touch = self._encode_node(
+                        [
+                            pack_nibble_range(
+                                current_key,
+                                curr_start + prefix + 1,
+                                curr_end,
+                                terminator,
+                            ),
+                            node[1],
+                        ]
                     )
 
             # in case there is a prefix set, because some parts of the path are equal we have to create a new extension
             # node where the content is in
             if prefix:
                 n, db_touch = self._encode_node(new_node)
-                new_node = [pack_nibbles(current_key[:prefix], False), n]
+                new_node = [
+                    pack_nibble_range(
+                        current_key, curr_start, curr_start + prefix, False
+                    ),
+                    n,
+                ]
             return new_node
 
     def delete(self, key: bytes) -> None:
@@ -307,24 +1334,11 @@ class Trie:
         if len(key) > 32:
             raise Exception("Max key length is 32")
 
-        self.root_node = self._delete(self.root_node, bin_to_nibbles(key))
+        self.root_node = self._delete(self.root_node, key, 0)
+        if self._flat_valid:
+            self._set_pending(FLAT_PREFIX + key, None)
 
-    @staticmethod
-    def _get_node_type(node: list) -> int:
-        """
-        Returns the type of the node
-
-        :param node: String or list
-        :return: Node type
-        """
-        if node == BLANK_NODE:
-            return BLANK
-        elif len(node) == 2:
-            # check if the terminator is set.
-            return LEAF if (ord(node[0][0:1]) & 0x20) == 0x20 else EXTENSION
-        elif len(node) == 17:
-            return BRANCH
-        return -1
+    _get_node_type = staticmethod(get_node_type)
 
     def _encode_node(self, node: list) -> (bytes, int):
         """
@@ -337,15 +1351,33 @@ class Trie:
         if node == BLANK_NODE:
             return BLANK_NODE, 0
         assert isinstance(node, list)
-        rlp_node = rlp.encode(node)
-
-        # in case the encoded data has lesser than 32 characters, we return rather the node than the hash
-        # can be used for some optimization in case the comments are out
-        if len(rlp_node) < 32:
-            return node, 0
-
-        hash_key = utils.sha3(rlp_node)
-        self.db.put(hash_key, rlp_node)
+        if isinstance(node, Node):
+            # the node has been encoded before, it only has to be stored if that did not happen yet
+            if node.rlp is not None and len(node.rlp) < 32:
+                return node, 0
+            hash_key = node_hash(node)
+            if not node.dirty:
+                return hash_key, 0
+            rlp_node = node.rlp
+            node.dirty = False
+        else:
+            rlp_node = encode_node(node)
+
+            # in case the encoded data has lesser than 32 characters, we return rather the node than the hash
+            # can be used for some optimization in case the comments are out
+            if len(rlp_node) < 32:
+                return node, 0
+
+            hash_key = utils.sha3(rlp_node)
+            if self.cache is not None:
+                # the next update on this path is going to decode the node again
+                self.cache.put(
+                    hash_key, make_node(node, rlp_node, hash_key), len(rlp_node)
+                )
+        if self.write_back:
+            self._dirty[hash_key] = rlp_node
+        else:
+            self.db.put(hash_key, rlp_node)
         return hash_key, 1
 
     def _decode_to_node(self, encoded: str) -> list:
@@ -360,115 +1392,219 @@ class Trie:
             return BLANK_NODE
         if isinstance(encoded, list):
             return encoded
-        return rlp.decode(self.db.get(encoded))
+        if self.cache is not None:
+            node = self.cache.get(encoded)
+            if node is not None:
+                return node
+        rlp_node = self._get_rlp(encoded)
+        node = self._make_decoded_node(rlp_node, encoded)
+        if self.cache is not None:
+            self.cache.put(encoded, node, len(rlp_node))
+        return node
 
-    def _delete(self, node: list, key: list):
+    @staticmethod
+    def _make_decoded_node(rlp_node: bytes, hash_key: bytes) -> list:
         """
-        Recursive delete function :)
+        Decodes a node which has been read from the db or the buffer
 
-        :param node: List which is used to go down the rabbit hole
-        :param key: Path we are following
-        :return:
+        :param rlp_node: rlp encoded node
+        :param hash_key: Hash the node is stored under
+        :return: The node as instance of its node class, or BLANK_NODE
         """
-        node_type = self._get_node_type(node)
-        if node_type == BLANK:
-            return BLANK_NODE
-
-        if node_type == BRANCH:
-            return self._delete_branch_node(node, key)
-
-        if node_type == LEAF:
-            return self._delete_leaf_node(node, key)
-
-        if node_type == EXTENSION:
-            return self._delete_extension_node(node, key)
+        if rlp_node is None:
+            raise Exception("Node %s is missing in the db" % hash_key.hex())
+        node = decode_node(rlp_node)
+        if node == BLANK_NODE:
+            return node
+        return make_node(node, rlp_node, hash_key)
 
-    def _delete_branch_node(self, node: list, key: list) -> list:
+    def _resolve_many(self, refs: list) -> list:
         """
-        Called when we have a branch node and check if we either follow the path or if we found value which is going
-        to be deleted.
+        Like _decode_to_node for several references at once. Nodes which are neither cached nor buffered are read with
+        a single multi_get from the db.
 
-        :param node: List which represents the branch node
-        :param key: A list of nibbles
-        :return: A list which represents a new node
+        :param refs: List of node references (hashes, inline nodes or blank nodes)
+        :return: List of decoded nodes in the same order
         """
-        # if the key list is empty we set the value of the branch node to blank
-        if not key:
-            node[-1] = BLANK_NODE
-            # normalize the branch node
-            return self._normalize_branch_node(node)
+        nodes = []
+        missing = []
+        for i, ref in enumerate(refs):
+            if (
+                isinstance(ref, list)
+                or ref == BLANK_NODE
+                or ref in self._dirty
+                or (self.cache is not None and ref in self.cache)
+            ):
+                nodes.append(self._decode_to_node(ref))
+            else:
+                nodes.append(None)
+                missing.append(i)
+
+        if missing:
+            rlp_nodes = self.db.multi_get([refs[i] for i in missing])
+            for i, rlp_node in zip(missing, rlp_nodes):
+                nodes[i] = self._make_decoded_node(rlp_node, refs[i])
+                if self.cache is not None:
+                    self.cache.put(refs[i], nodes[i], len(rlp_node))
+        return nodes
+
+    def put_entry(self, key: bytes, data: bytes) -> None:
+        """
+        Stores an entry which is not a node in the db of the trie. In write-back mode it is written in the same batch
+        as the nodes of the next commit.
 
-        # Decode the node and go one step deeper into recursion
-        n = self._delete(self._decode_to_node(node[key[0]]), key[1:])
-        n, db_touch = self._encode_node(n)
+        :param key: Key of the entry, it must not have a length of 32 bytes to not collide with node hashes
+        :param data: Data of the entry, None to delete the entry
+        """
+        assert len(key) != 32
+        if self.write_back:
+            self._set_pending(key, data)
+        elif data is None:
+            self.db.delete(key)
+        else:
+            self.db.put(key, data)
 
-        if n == node[key[0]]:
-            return node
+    def get_entry(self, key: bytes) -> bytes:
+        """
+        Returns an entry which has been stored with put_entry
 
-        node[key[0]] = n
-        if n == BLANK_NODE:
-            # Normalize the node
-            return self._normalize_branch_node(node)
+        :param key: Key of the entry
+        :return: The data of the entry or None
+        """
+        if key in self._pending:
+            return self._pending[key]
+        return self.db.get(key)
 
-        return node
+    def _get_rlp(self, hash_key: bytes) -> bytes:
+        """
+        Returns the rlp encoded node which is stored under the given hash, either in the buffer or in the db
 
-    def _delete_leaf_node(self, node: list, key: list) -> list:
+        :param hash_key: Hash of the node
+        :return: The rlp encoded node
         """
-        Called when we have a leaf node.
+        rlp_node = self._dirty.get(hash_key)
+        if rlp_node is None:
+            rlp_node = self.db.get(hash_key)
+        if rlp_node is None:
+            if hash_key == BLANK_ROOT_HASH:
+                # the blank root is only stored once a trie has been committed
+                return encode_node(BLANK_NODE)
+            raise Exception("Node %s is missing in the db" % hash_key.hex())
+        return rlp_node
 
-        :param node: List which represents the leaf node
-        :param key: A list of nibbles
-        :return: In case the leaf node has the key given key the blank node is returned, otherwise the node itself
+    @staticmethod
+    def _child_refs(node: list) -> list:
         """
-        curr_key = unpack_to_nibbles(node[0])
+        Returns the references (hashes or inline nodes) to the children of a node
 
-        if not starts_with(key, curr_key):
-            # key not found
-            return node
+        :param node: A list which represents a node
+        :return: List of non blank child references
+        """
+        node_type = Trie._get_node_type(node)
+        if node_type == BRANCH:
+            return [ref for ref in node[:16] if ref != BLANK_NODE]
+        if node_type == EXTENSION:
+            return [node[1]]
+        return []
 
-        return BLANK_NODE if key == curr_key else node
+    def _delete(self, node: list, key: bytes, pos: int):
+        """
+        Deletes the value under the given key. The path down to the value is kept on a stack, afterwards the nodes on
+        this path are rebuilt and normalized on the way back up.
 
-    def _delete_extension_node(self, node: list, key: list) -> list:
+        :param node: The node where the path of the key starts
+        :param key: Path we are following
+        :param pos: Position of the next key nibble, the nibbles before are the path to node
+        :return: A new node, or the given node if the key has not been found
+        """
+        root = node
+        key_end = len(key) * 2
+        # (parent, index) for branch nodes, (parent, None) for extension nodes
+        path = []
+        while True:
+            node_type = self._get_node_type(node)
+            if node_type == BLANK:
+                return root
+
+            if node_type == BRANCH:
+                if pos == key_end:
+                    # the key is exhausted, so we set the value of the branch node to blank
+                    if node[-1] == BLANK_NODE:
+                        return root
+                    new_node = node[:]
+                    new_node[-1] = BLANK_NODE
+                    # normalize the branch node
+                    new_node = self._normalize_branch_node(new_node)
+                    break
+                # Decode the node and go one step deeper
+                index = nibble_at(key, pos)
+                path.append((node, index))
+                node = self._decode_to_node(node[index])
+                pos += 1
+                continue
+
+            curr_start, curr_end = path_range(node[0])
+            curr_length = curr_end - curr_start
+            if (
+                common_prefix_length(node[0], curr_start, curr_end, key, pos, key_end)
+                < curr_length
+            ):
+                # key not found
+                return root
+
+            if node_type == LEAF:
+                if key_end - pos != curr_length:
+                    # key not found
+                    return root
+                new_node = BLANK_NODE
+                break
+
+            # we take the key parts which overlap and continue with the node which is within the extension node
+            path.append((node, None))
+            node = self._decode_to_node(node[1])
+            pos += curr_length
+
+        while path:
+            parent, index = path.pop()
+            if index is None:
+                new_node = self._delete_from_extension_node(parent, new_node)
+                continue
+
+            n, db_touch = self._encode_node(new_node)
+            # decoded nodes might be shared with the cache or an older root, so we work on a copy
+            new_node = parent[:]
+            new_node[index] = n
+            if n == BLANK_NODE:
+                # Normalize the node
+                new_node = self._normalize_branch_node(new_node)
+        return new_node
+
+    def _delete_from_extension_node(self, node: list, new_sub_node: list) -> list:
         """
-        Called when we have a extension node.
+        Called when the node below an extension node has changed during a delete.
 
         :param node: List which represents the extension node
-        :param key: A list of nibbles
-        :return: In case the leaf node has the key given key the blank node is returned, otherwise the node itself
+        :param new_sub_node: The new node below the extension node
+        :return: A list which represents the new node replacing the extension node
         """
-        curr_key = unpack_to_nibbles(node[0])
-
-        if not starts_with(key, curr_key):
-            # key not found
-            return node
-
-        # we take the key parts which overlap, decode the node which is within the extension node and
-        # call the delete function
-        new_sub_node = self._delete(self._decode_to_node(node[1]), key[len(curr_key) :])
-
-        # if the hash hasn't changed, just return the node
-        if self._encode_node(new_sub_node) == node[1]:
-            return node
-
         # new sub node is BLANK_NODE
         if new_sub_node == BLANK_NODE:
             return BLANK_NODE
 
-        # the hash has changed, therefore we check what type the subnode has
+        # the sub node has changed, therefore we check what type the subnode has
         new_sub_node_type = self._get_node_type(new_sub_node)
 
         # if it is a leaf or extension node
         if is_key_value_type(new_sub_node_type):
             # collapse subnode to this node, note this node will have same
             # terminator with the new sub node, and value does not change
-            new_key = curr_key + unpack_to_nibbles(new_sub_node[0])
+            new_key = unpack_to_nibbles(node[0]) + unpack_to_nibbles(new_sub_node[0])
             terminator = True if new_sub_node_type == LEAF else False
             return [pack_nibbles(new_key, terminator), new_sub_node[1]]
 
-        if new_sub_node_type == BRANCH:
-            n, db_touch = self._encode_node(new_sub_node)
-            # creating a extension node
-            return [pack_nibbles(curr_key, False), n]
+        n, db_touch = self._encode_node(new_sub_node)
+        # creating a extension node, the path stays the same
+        return [node[0], n]
 
     def _normalize_branch_node(self, node: list) -> list:
         """
@@ -502,26 +1638,5 @@ class Trie:
             terminator = True if sub_node_type == LEAF else False
             return [pack_nibbles(new_key, terminator), sub_node[1]]
         else:
-            # since it is not a leaf or extension node, we have a branch node
-            n, db_touch = self._encode_node(sub_node)
-            # we pack it into an extension node
-            return [pack_nibbles([not_blank_index], False), n]
-
-    def _delete_node(self, node: list) -> None:
-        """
-        Deletes node from storage
-
-        :param node: node in form of list, or BLANK_NODE
-        :return: None
-        """
-        node_type = self._get_node_type(node)
-        if node_type == BLANK:
-            return
-        elif node_type == EXTENSION:
-            self.db.delete(utils.sha3(rlp.encode(node[1])))
-        else:
-            assert isinstance(node, list)
-            encoded, db_touch = self._encode_node(node)
-            if len(encoded) < 32:
-                return
-            self.db.delete(encoded)
+            # since it is not a leaf or extension node, we have a branch node, which is referenced as it is
+            return [pack_nibbles([not_blank_index], False), node[not_blank_index]]
@@ -1,7 +1,36 @@
 import shutil
 
+from mpt import db
+
 DB_PATH = "./testdb"
 
 
 def delete_db_dir():
     shutil.rmtree(DB_PATH)
+
+
+class CountingDB(db.MemoryDB):
+    """
+    MemoryDB which counts the calls of get, multi_get and put, as well as the number of keys read by both getters
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+        self.multi_gets = 0
+        self.reads = 0
+        self.puts = 0
+
+    def get(self, key):
+        self.gets += 1
+        self.reads += 1
+        return super().get(key)
+
+    def multi_get(self, keys):
+        self.multi_gets += 1
+        self.reads += len(keys)
+        return super().multi_get(keys)
+
+    def put(self, key, data):
+        self.puts += 1
+        super().put(key, data)
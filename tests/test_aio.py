@@ -0,0 +1,99 @@
+import asyncio
+import random
+import threading
+from unittest import TestCase
+
+from mpt import db
+from mpt.aio import AsyncDB, AsyncTrie
+from mpt.trie import Trie
+
+
+class SlowDB(AsyncDB):
+    def __init__(self, store: db.BaseDB):
+        self.store = store
+        self.gets = []
+
+    async def get(self, key):
+        self.gets.append(key)
+        await asyncio.sleep(0.001)
+        return self.store.get(key)
+
+
+class AsyncTrieTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(8)
+        self.store = db.MemoryDB()
+        t = Trie(self.store)
+        self.items = {}
+        for _ in range(300):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 5)))
+            self.items[key] = b"value" * rnd.randrange(1, 10)
+            t.update(key, self.items[key])
+        t.commit()
+        self.trie = t
+
+    def test_threadPoolBackend(self):
+        async def run():
+            t = AsyncTrie(self.store, self.trie.root_hash)
+            for key, value in list(self.items.items())[:50]:
+                self.assertEqual(await t.get_value(key), value)
+            self.assertEqual(await t.get_value(b"missing key"), b"")
+            self.assertEqual(await t.get_proof(b"abc"), self.trie.get_proof(b"abc"))
+            key = list(self.items)[7]
+            self.assertEqual(await t.get_proof(key), self.trie.get_proof(key))
+
+        asyncio.run(run())
+
+    def test_sharedFetches(self):
+        backend = SlowDB(self.store)
+
+        async def run():
+            t = AsyncTrie(backend, self.trie.root_hash, cache_size=1 << 20)
+            keys = list(self.items)
+            self.assertEqual(await t.get_many(keys), list(self.items.values()))
+
+        asyncio.run(run())
+        self.assertEqual(len(backend.gets), len(set(backend.gets)))
+
+    def test_loopIsNotBlocked(self):
+        release = threading.Event()
+
+        class BlockingDB(db.MemoryDB):
+            def get(self, key):
+                release.wait(1)
+                return super().get(key)
+
+        store = BlockingDB()
+        store.write_batch(self.store.iterate_prefix())
+
+        async def run():
+            lookup = asyncio.ensure_future(
+                AsyncTrie(store, self.trie.root_hash).get_value(list(self.items)[0])
+            )
+            await asyncio.sleep(0.01)
+            self.assertFalse(lookup.done())
+            release.set()
+            self.assertEqual(await lookup, list(self.items.values())[0])
+
+        asyncio.run(run())
+
+    def test_missingNode(self):
+        async def run():
+            with self.assertRaises(Exception):
+                await AsyncTrie(db.MemoryDB(), self.trie.root_hash).get_value(b"a")
+
+        asyncio.run(run())
+
+    def test_pruneKeepsReaderRoot(self):
+        old_root = self.trie.root_hash
+        reader = AsyncTrie(self.store, old_root)
+        for key in list(self.items)[:100]:
+            self.trie.delete(key)
+        self.trie.commit()
+        self.assertGreater(self.trie.prune(), 0)
+
+        async def run():
+            for key, value in self.items.items():
+                self.assertEqual(await reader.get_value(key), value)
+
+        asyncio.run(run())
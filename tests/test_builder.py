@@ -0,0 +1,142 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from mpt import db
+from mpt.builder import TrieBuilder
+from mpt.trie import Trie
+
+
+class TrieBuilderTest(TestCase):
+    def _trie_root(self, items: list) -> bytes:
+        t = Trie(db.MemoryDB())
+        for key, value in items:
+            t.update(key, value)
+        return t.get_root_hash()
+
+    def _assert_same_root(self, items: list):
+        expected = self._trie_root(items)
+        store = db.MemoryDB()
+        root = TrieBuilder(store, batch_size=7).build(sorted(items))
+        self.assertEqual(root.hex(), expected.hex())
+
+        t = Trie(store, root)
+        for key, value in items:
+            self.assertEqual(t.get_value(key), value)
+
+    def test_exampleTrie(self):
+        self._assert_same_root(
+            [
+                [b"do", b"verb"],
+                [b"dog", b"puppy"],
+                [b"doge", b"coin"],
+                [b"horse", b"stallion"],
+            ]
+        )
+
+    def test_insertMiddleLeaf(self):
+        self._assert_same_root(
+            [
+                [b"key1aa", b"0123456789012345678901234567890123456789xxx"],
+                [b"key1", b"0123456789012345678901234567890123456789Very_Long"],
+                [b"key2bb", b"aval3"],
+                [b"key2", b"short"],
+                [b"key3cc", b"aval3"],
+                [b"key3", b"1234567890123456789012345678901"],
+            ]
+        )
+
+    def test_singleItem(self):
+        self._assert_same_root(
+            [[b"A", b"aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"]]
+        )
+
+    def test_randomKeys(self):
+        rnd = random.Random(42)
+        items = {}
+        for _ in range(500):
+            key = bytes(rnd.randrange(4) for _ in range(rnd.randrange(1, 6)))
+            items[key] = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 40)))
+        self._assert_same_root(list(items.items()))
+
+    def test_emptyValues(self):
+        self._assert_same_root([[b"a", b"1"], [b"b", b""]])
+        rnd = random.Random(4)
+        items = {}
+        for _ in range(300):
+            key = bytes(rnd.randrange(4) for _ in range(rnd.randrange(1, 6)))
+            items[key] = b"" if rnd.random() < 0.3 else b"v" * rnd.randrange(1, 40)
+        self._assert_same_root(list(items.items()))
+
+    def test_emptyTrie(self):
+        self.assertEqual(
+            TrieBuilder(db.MemoryDB()).build([]).hex(),
+            "56e81f171bcc55a6ff8345e692c0f86e5b48e01b996cadc001622fb5e363b421",
+        )
+
+    def test_unsortedKeys(self):
+        builder = TrieBuilder(db.MemoryDB())
+        builder.add(b"b", b"1")
+        with self.assertRaises(Exception):
+            builder.add(b"a", b"2")
+
+
+class ParallelBuildTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        self.items = {}
+        for _ in range(600):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 4)))
+            self.items[key] = b"x" * rnd.randrange(1, 40)
+        self.serial = TrieBuilder(db.MemoryDB()).build(sorted(self.items.items()))
+
+    def test_threadPool(self):
+        for fan_out in (1, 2):
+            store = db.MemoryDB()
+            with ThreadPoolExecutor(4) as executor:
+                root = TrieBuilder(store).build_parallel(
+                    sorted(self.items.items()), fan_out=fan_out, executor=executor
+                )
+            self.assertEqual(root, self.serial)
+            t = Trie(store, root)
+            for key, value in self.items.items():
+                self.assertEqual(t.get_value(key), value)
+
+    def test_processPool(self):
+        root = TrieBuilder(db.MemoryDB()).build_parallel(
+            sorted(self.items.items()), max_workers=2
+        )
+        self.assertEqual(root, self.serial)
+
+    def test_fewGroups(self):
+        for items in (
+            [],
+            [(b"\x12", b"a")],
+            [(b"\x12", b"a" * 40), (b"\x12\x34", b"b" * 40)],
+            [(b"\x12\x34", b"a"), (b"\x13\x34", b"b")],
+            [(b"\x12\x34", b"a" * 40), (b"\x1f", b"b"), (b"\x20", b"c")],
+        ):
+            expected = TrieBuilder(db.MemoryDB()).build(items)
+            for fan_out in (1, 2):
+                with ThreadPoolExecutor(2) as executor:
+                    root = TrieBuilder(db.MemoryDB()).build_parallel(
+                        items, fan_out=fan_out, executor=executor
+                    )
+                self.assertEqual(root, expected)
+
+    def test_emptyKey(self):
+        for items in (
+            [(b"", b"e")],
+            [(b"", b"e"), (b"\x01", b"a"), (b"\x12", b"b")],
+            [(b"", b"e" * 40), (b"\x12\x34", b"a" * 40), (b"\x12\x35", b"b")],
+            [(b"", b"")] + sorted(self.items.items()),
+        ):
+            t = Trie(db.MemoryDB())
+            for key, value in items:
+                t.update(key, value)
+            for fan_out in (1, 2):
+                with ThreadPoolExecutor(2) as executor:
+                    root = TrieBuilder(db.MemoryDB()).build_parallel(
+                        items, fan_out=fan_out, executor=executor, max_pending=1
+                    )
+                self.assertEqual(root, t.get_root_hash())
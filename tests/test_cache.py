@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from mpt import db
+from mpt.cache import LRUCache
+from mpt.trie import Trie
+
+
+class LRUCacheTest(TestCase):
+    def test_evictsLeastRecentlyUsed(self):
+        cache = LRUCache(10)
+        cache.put(b"a", 1, 4)
+        cache.put(b"b", 2, 4)
+        self.assertEqual(cache.get(b"a"), 1)
+        cache.put(b"c", 3, 4)
+        self.assertNotIn(b"b", cache)
+        self.assertIn(b"a", cache)
+        self.assertIsNone(cache.get(b"b"))
+        self.assertEqual(cache.stats(), (1, 1, 1, 8, 10))
+
+    def test_oversizedEntryIsNotCached(self):
+        cache = LRUCache(10)
+        cache.put(b"a", 1, 11)
+        self.assertEqual(len(cache), 0)
+
+
+class TrieCacheTest(TestCase):
+    def test_cachedNodesAreNotModified(self):
+        t = Trie(db.MemoryDB(), cache_size=1 << 20)
+        for i in range(64):
+            t.update(bytes([i, i]), b"value" * 8)
+        t.commit()
+        root = t.root_hash
+
+        t.set_root_node(root)
+        for i in range(64):
+            t.update(bytes([i, i]), b"changed" * 8)
+        t.delete(bytes([0, 0]))
+        self.assertGreater(t.cache.hits, 0)
+
+        t.set_root_node(root)
+        self.assertEqual(t.get_root_hash(), root)
+        self.assertEqual(t.get_value(bytes([0, 0])), b"value" * 8)
+        self.assertEqual(t.get_value(bytes([63, 63])), b"value" * 8)
+
+    def test_sameRootHash(self):
+        t = Trie(db.MemoryDB(), cache_size=256)
+        for key, value in [
+            [b"do", b"verb"],
+            [b"ether", b"wookiedoo"],
+            [b"horse", b"stallion"],
+            [b"shaman", b"horse"],
+            [b"doge", b"coin"],
+            [b"dog", b"puppy"],
+        ]:
+            t.update(key, value)
+        t.delete(b"ether")
+        t.delete(b"shaman")
+        self.assertEqual(
+            t.get_root_hash().hex(),
+            "5991bb8c6514148a29db676a14ac506cd2cd5775ace63c30a4fe457715e9ac84",
+        )
+        self.assertLessEqual(t.cache.size, 256)
+
+
+class PrefetchTest(TestCase):
+    def setUp(self):
+        self.store = db.MemoryDB()
+        t = Trie(self.store)
+        for i in range(256):
+            t.update(bytes([i, 255 - i]), b"value" * 8)
+        t.commit()
+        self.root = t.root_hash
+
+    def test_updatesReadNoNodes(self):
+        t = Trie(self.store, self.root, cache_size=1 << 20)
+        keys = [bytes([i, 255 - i]) for i in range(0, 256, 3)]
+        values = t.prefetch(keys).result()
+        self.assertEqual(values[keys[0]], b"value" * 8)
+
+        misses = t.cache.misses
+        for key in keys:
+            t.update(key, b"changed")
+        self.assertEqual(t.cache.misses, misses)
+
+        expected = Trie(self.store, self.root)
+        for key in keys:
+            expected.update(key, b"changed")
+        self.assertEqual(t.get_root_hash(), expected.get_root_hash())
+
+    def test_concurrentUpdates(self):
+        t = Trie(self.store, self.root, cache_size=1 << 12)
+        futures = [
+            t.prefetch([bytes([i, 255 - i]) for i in range(start, 256, 4)])
+            for start in range(4)
+        ]
+        for i in range(256):
+            t.update(bytes([i, 255 - i]), b"changed")
+        for future in futures:
+            future.result()
+        self.assertLessEqual(t.cache.size, 1 << 12)
+        self.assertEqual(t.get_value(bytes([7, 248])), b"changed")
+
+    def test_needsCache(self):
+        with self.assertRaises(Exception):
+            Trie(self.store, self.root).prefetch([b"a"])
@@ -0,0 +1,53 @@
+import random
+from unittest import TestCase
+
+import rlp
+from mpt import db
+from mpt.codec import decode_node, encode_node
+from mpt.trie import Trie
+
+
+class CodecTest(TestCase):
+    def _assert_same(self, node):
+        encoded = rlp.encode(node)
+        self.assertEqual(encode_node(node), encoded)
+        self.assertEqual(decode_node(encoded), rlp.decode(encoded))
+        self.assertEqual(decode_node(memoryview(encoded)), node)
+
+    def test_shapes(self):
+        self._assert_same(b"")
+        self._assert_same([b"\x20\x01", b"\x01"])
+        self._assert_same([b"\x20\x01", b"\x80"])
+        self._assert_same([b"\x20\x01", b"x" * 55])
+        self._assert_same([b"\x20\x01", b"x" * 56])
+        self._assert_same([b"\x20\x01", b"x" * 70000])
+        self._assert_same([b"h" * 32] * 16 + [b""])
+        self._assert_same([[b"\x31", b"a"], b""] + [b""] * 14 + [b"value"])
+
+    def test_storedNodes(self):
+        rnd = random.Random(4)
+        t = Trie(db.MemoryDB())
+        for _ in range(500):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 33)))
+            value = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 100)))
+            t.update(key, value)
+        t.commit()
+        for _, rlp_node in t.db.iterate_prefix():
+            self._assert_same(rlp.decode(rlp_node))
+
+    def test_invalidInput(self):
+        for data in (
+            None,
+            b"",
+            b"\xc2\x80",
+            b"\x81\x01",
+            b"\xb8\x01x",
+            b"\xc1\x80\x80",
+            b"\xc2\x82\x01",
+            b"\x82abc",
+        ):
+            with self.assertRaises(rlp.DecodingError):
+                decode_node(data)
+
+        with self.assertRaises(rlp.EncodingError):
+            encode_node([b"a", 1])
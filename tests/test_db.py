@@ -0,0 +1,85 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import Trie
+from tests import DB_PATH
+from tests import delete_db_dir
+
+
+class BackendTestMixin:
+    def make_db(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.db = self.make_db()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_putGetDelete(self):
+        self.db.put(b"a", b"1")
+        self.assertEqual(self.db.get(b"a"), b"1")
+        self.db.delete(b"a")
+        self.assertIsNone(self.db.get(b"a"))
+
+    def test_writeBatch(self):
+        self.db.put(b"gone", b"x")
+        self.db.write_batch([(b"a", b"1"), (b"b", b"2")], [b"gone"])
+        self.assertEqual(self.db.multi_get([b"b", b"gone", b"a"]), [b"2", None, b"1"])
+
+    def test_iteratePrefix(self):
+        self.db.write_batch(
+            [(b"\x01\xff", b"1"), (b"\x01\x00", b"0"), (b"\x02", b"2"), (b"\x01", b"")]
+        )
+        self.assertEqual(
+            list(self.db.iterate_prefix(b"\x01")),
+            [(b"\x01", b""), (b"\x01\x00", b"0"), (b"\x01\xff", b"1")],
+        )
+        self.assertEqual(len(list(self.db.iterate_prefix())), 4)
+
+    def test_trieRootHash(self):
+        t = Trie(self.db)
+        for key, value in [
+            [b"doe", b"reindeer"],
+            [b"dog", b"puppy"],
+            [b"dogglesworth", b"cat"],
+        ]:
+            t.update(key, value)
+        self.assertEqual(
+            t.get_root_hash().hex(),
+            "8aad789dff2f538bca5d8ea56e8abe10f4c7ba3a5dea95fea4cd6e7c3a1168d3",
+        )
+        self.assertEqual(t.get_value(b"dogglesworth"), b"cat")
+
+
+class MemoryDBTest(BackendTestMixin, TestCase):
+    def make_db(self):
+        return db.MemoryDB()
+
+
+class LevelDBTest(BackendTestMixin, TestCase):
+    def make_db(self):
+        return db.DB(DB_PATH)
+
+    def tearDown(self):
+        super().tearDown()
+        delete_db_dir()
+
+
+class SQLiteDBTest(BackendTestMixin, TestCase):
+    def make_db(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        return db.SQLiteDB(os.path.join(self.tmp_dir.name, "trie.sqlite"))
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp_dir.cleanup()
+
+    def test_iterateManyPages(self):
+        self.db.write_batch((i.to_bytes(2, "big"), b"") for i in range(1200))
+        self.assertEqual(
+            [key for key, _ in self.db.iterate_prefix()],
+            [i.to_bytes(2, "big") for i in range(1200)],
+        )
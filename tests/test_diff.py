@@ -0,0 +1,61 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import BLANK_ROOT, Trie
+from tests import CountingDB
+
+
+class DiffTest(TestCase):
+    def _expected(self, old: dict, new: dict) -> list:
+        return [
+            (key, old.get(key, b""), new.get(key, b""))
+            for key in sorted(set(old) | set(new))
+            if old.get(key, b"") != new.get(key, b"")
+        ]
+
+    def test_randomChanges(self):
+        rnd = random.Random(17)
+        for _ in range(20):
+            store = db.MemoryDB()
+            t = Trie(store)
+            old = {}
+            for _ in range(rnd.randrange(0, 80)):
+                key = bytes(rnd.randrange(3) for _ in range(rnd.randrange(0, 5)))
+                old[key] = bytes(
+                    rnd.randrange(256) for _ in range(rnd.randrange(1, 40))
+                )
+                t.update(key, old[key])
+            t.commit()
+            root_a = t.root_hash
+
+            new = dict(old)
+            for _ in range(rnd.randrange(0, 10)):
+                key = bytes(rnd.randrange(3) for _ in range(rnd.randrange(0, 5)))
+                if key in new and rnd.random() < 0.5:
+                    del new[key]
+                    t.delete(key)
+                else:
+                    new[key] = b"new" * rnd.randrange(1, 15)
+                    t.update(key, new[key])
+            t.commit()
+            root_b = t.root_hash
+
+            self.assertEqual(list(t.diff(root_a, root_b)), self._expected(old, new))
+            self.assertEqual(list(t.diff(root_b, root_a)), self._expected(new, old))
+            self.assertEqual(list(t.diff(BLANK_ROOT, root_b)), self._expected({}, new))
+
+    def test_identicalSubtreesAreSkipped(self):
+        store = CountingDB()
+        t = Trie(store)
+        for i in range(1000):
+            t.update(i.to_bytes(4, "big"), b"value" * 8)
+        t.commit()
+        root_a = t.root_hash
+        t.update((500).to_bytes(4, "big"), b"changed")
+        t.commit()
+
+        store.gets = 0
+        diff = list(t.diff(root_a, t.root_hash))
+        self.assertEqual(diff, [((500).to_bytes(4, "big"), b"value" * 8, b"changed")])
+        self.assertLess(store.gets, 20)
@@ -0,0 +1,172 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import FLAT_PREFIX, FLAT_ROOT_KEY, Trie
+from tests import CountingDB
+
+
+class FlatLayerTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(13)
+        self.items = {
+            bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 33))): b"v" * i
+            for i in range(1, 200)
+        }
+
+    def _flat_entries(self, store: db.BaseDB) -> dict:
+        return {
+            key[len(FLAT_PREFIX) :]: value
+            for key, value in store.iterate_prefix(FLAT_PREFIX)
+        }
+
+    def test_keptInSync(self):
+        for write_back in (False, True):
+            store = CountingDB()
+            t = Trie(store, write_back=write_back, flat=True)
+            for key, value in self.items.items():
+                t.update(key, value)
+            deleted = list(self.items)[:50]
+            for key in deleted:
+                t.delete(key)
+            t.commit()
+            root = t.root_hash
+            self.assertEqual(store.get(FLAT_ROOT_KEY), root)
+            self.assertEqual(
+                self._flat_entries(store),
+                {k: v for k, v in self.items.items() if k not in deleted},
+            )
+
+            t = Trie(store, root, flat=True)
+            store.gets = store.multi_gets = 0
+            for key, value in self.items.items():
+                self.assertEqual(t.get_value(key), b"" if key in deleted else value)
+            # the entry and the root marker are read with one call
+            self.assertEqual(store.gets, 0)
+            self.assertEqual(store.multi_gets, len(self.items))
+
+    def test_otherRootWalksTrie(self):
+        store = db.MemoryDB()
+        t = Trie(store, flat=True)
+        t.update(b"dog", b"puppy")
+        t.commit()
+        old_root = t.root_hash
+        t.update(b"dog", b"wolf")
+        t.commit()
+
+        t.set_root_node(old_root)
+        self.assertFalse(t._flat_valid)
+        self.assertEqual(t.get_value(b"dog"), b"puppy")
+        t.update(b"horse", b"stallion")
+        t.commit()
+        self.assertEqual(store.get(FLAT_PREFIX + b"dog"), b"wolf")
+
+    def test_uncommittedChangesAreDropped(self):
+        store = db.MemoryDB()
+        t = Trie(store, flat=True)
+        t.update(b"dog", b"puppy")
+        t.commit()
+        root = t.root_hash
+        t.update(b"dog", b"wolf")
+        self.assertEqual(t.get_value(b"dog"), b"wolf")
+        t.set_root_node(root)
+        self.assertEqual(t.get_value(b"dog"), b"puppy")
+
+    def test_regenerate(self):
+        store = db.MemoryDB()
+        t = Trie(store)
+        for key, value in self.items.items():
+            t.update(key, value)
+        t.commit()
+        root = t.root_hash
+        store.put(FLAT_PREFIX + b"stale", b"x")
+        store.put(FLAT_PREFIX + list(self.items)[0], b"x")
+
+        t = Trie(store, root, flat=True)
+        self.assertFalse(t._flat_valid)
+        t.regenerate_flat(batch_size=7)
+        self.assertTrue(t._flat_valid)
+        self.assertEqual(self._flat_entries(store), self.items)
+        self.assertEqual(store.get(FLAT_ROOT_KEY), root)
+
+    def test_regenerateInBackground(self):
+        store = db.MemoryDB()
+        t = Trie(store)
+        for key, value in self.items.items():
+            t.update(key, value)
+        t.commit()
+
+        t = Trie(store, t.root_hash, flat=True)
+        t.regenerate_flat(background=True).result()
+        self.assertFalse(t._flat_valid)
+        self.assertEqual(t.get_value(list(self.items)[3]), list(self.items.values())[3])
+
+        t.commit()
+        self.assertTrue(t._flat_valid)
+        self.assertEqual(self._flat_entries(store), self.items)
+
+    def test_otherWriter(self):
+        store = db.MemoryDB()
+        a = Trie(store, flat=True)
+        a.update(b"k", b"v1")
+        a.update(b"dog", b"puppy")
+        a.commit()
+        b = Trie(store, a.root_hash, flat=True)
+        b.update(b"k", b"v2")
+        b.commit()
+
+        self.assertEqual(a.get_value(b"k"), b"v1")
+        self.assertEqual(a.get_many([b"k", b"dog"]), [b"v1", b"puppy"])
+        self.assertFalse(a._flat_valid)
+        # the layer of the other root is left alone
+        a.update(b"cat", b"kitten")
+        a.commit()
+        self.assertEqual(store.get(FLAT_ROOT_KEY), b.root_hash)
+        self.assertIsNone(store.get(FLAT_PREFIX + b"cat"))
+        self.assertEqual(Trie(store, b.root_hash, flat=True).get_value(b"k"), b"v2")
+
+    def test_otherWriterBeforeCommit(self):
+        store = db.MemoryDB()
+        a = Trie(store, flat=True)
+        a.update(b"k", b"v1")
+        a.commit()
+        b = Trie(store, a.root_hash, flat=True)
+        a.update(b"k", b"v3")
+        b.update(b"x", b"y")
+        b.commit()
+
+        a.commit()
+        self.assertEqual(store.get(FLAT_ROOT_KEY), b.root_hash)
+        self.assertEqual(store.get(FLAT_PREFIX + b"k"), b"v1")
+        self.assertEqual(a.get_value(b"k"), b"v3")
+
+    def test_missingKey(self):
+        store = db.MemoryDB()
+        t = Trie(store, flat=True)
+        t.update(b"dog", b"puppy")
+        t.commit()
+        for trie in (t, Trie(store, t.root_hash)):
+            self.assertEqual(trie.get_value(b"cat"), b"")
+            self.assertEqual(trie.get_value(b"do"), b"")
+
+    def test_writeThroughRootHashWritesLayer(self):
+        store = db.MemoryDB()
+        t = Trie(store, flat=True)
+        for i, (key, value) in enumerate(self.items.items()):
+            t.update(key, value)
+            if i % 10 == 0:
+                t.get_root_hash()
+                # nothing piles up between the root hashes of a trie that is never committed
+                self.assertEqual(t._pending, {})
+        t.delete(list(self.items)[0])
+        root = t.get_root_hash()
+        self.assertEqual(t._pending, {})
+        self.assertEqual(store.get(FLAT_ROOT_KEY), root)
+        expected = dict(list(self.items.items())[1:])
+        self.assertEqual(self._flat_entries(store), expected)
+
+        other = Trie(store, root, flat=True)
+        self.assertTrue(other._flat_valid)
+        self.assertEqual(
+            other.get_value(list(self.items)[5]), expected[list(self.items)[5]]
+        )
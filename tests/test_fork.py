@@ -0,0 +1,124 @@
+from unittest import TestCase
+
+from mpt import db
+from mpt.secure import SecureTrie
+from mpt.trie import Trie
+
+
+class ForkTest(TestCase):
+    def _fill(self, t, count: int):
+        for i in range(count):
+            t.update(bytes([i, i]), b"value" * 8)
+
+    def test_forksDiverge(self):
+        for write_back in (False, True):
+            t = Trie(db.MemoryDB(), write_back=write_back, cache_size=1 << 16)
+            self._fill(t, 64)
+            base = dict(t.items())
+
+            a = t.fork()
+            b = t.fork()
+            a.update(b"\x00\x00", b"a")
+            a.delete(b"\x01\x01")
+            b.update(b"\x00\x00", b"b")
+            b.update(b"new", b"b")
+
+            self.assertEqual(dict(t.items()), base)
+            self.assertEqual(a.get_value(b"\x00\x00"), b"a")
+            self.assertFalse(a.get_value(b"\x01\x01"))
+            self.assertFalse(a.get_value(b"new"))
+            self.assertEqual(b.get_value(b"\x00\x00"), b"b")
+            self.assertEqual(b.get_value(b"\x01\x01"), b"value" * 8)
+            self.assertIs(a.cache, t.cache)
+
+    def test_commitForkOfUncommittedTrie(self):
+        store = db.MemoryDB()
+        t = Trie(store, write_back=True)
+        self._fill(t, 64)
+        base = dict(t.items())
+        fork = t.fork()
+        fork.update(b"new", b"value")
+        t.commit()
+        t.update(b"other", b"value")
+
+        fork_of_fork = fork.fork()
+        fork_of_fork.delete(b"new")
+        root = fork.get_root_hash()
+        self.assertEqual(dict(Trie(store, root).items()), {**base, b"new": b"value"})
+        self.assertEqual(fork_of_fork.get_value(b"new"), b"")
+        self.assertEqual(fork_of_fork.get_value(b"\x03\x03"), b"value" * 8)
+
+    def test_flatFork(self):
+        for write_back in (False, True):
+            store = db.MemoryDB()
+            p = Trie(store, write_back=write_back, flat=True)
+            p.update(b"a", b"1")
+            p.commit()
+            p.update(b"b", b"2")
+
+            f = p.fork()
+            f.update(b"a", b"FORK")
+            f.commit()
+            self.assertEqual(p.get_value(b"a"), b"1")
+            self.assertEqual(p.get_value(b"b"), b"2")
+            self.assertEqual(f.get_value(b"a"), b"FORK")
+            self.assertEqual(f.get_value(b"b"), b"2")
+
+            # the flat layer stays with the root of the fork
+            p.commit()
+            self.assertEqual(
+                Trie(store, f.root_hash, flat=True).get_value(b"a"), b"FORK"
+            )
+            self.assertEqual(Trie(store, p.root_hash, flat=True).get_value(b"a"), b"1")
+
+    def test_secureFork(self):
+        t = SecureTrie(db.MemoryDB(), preimages=True, write_back=True)
+        t.update(b"dog", b"puppy")
+        fork = t.fork()
+        fork.update(b"horse", b"stallion")
+        self.assertFalse(t.get_value(b"horse"))
+        self.assertIs(fork.key_cache, t.key_cache)
+        fork.commit()
+        self.assertEqual(
+            sorted(fork.items()), [(b"dog", b"puppy"), (b"horse", b"stallion")]
+        )
+
+    def test_pendingEntriesAreShared(self):
+        t = Trie(db.MemoryDB(), write_back=True, flat=True)
+        t.update(b"dog", b"puppy")
+        t.update(b"cat", b"kitten")
+        t.put_entry(b"note", b"parent")
+        fork = t.fork()
+        # the entries are not copied, both tries see them through the shared map
+        self.assertIs(fork._pending.maps[1], t._pending.maps[1])
+        self.assertEqual(fork._pending.maps[0], {})
+        self.assertEqual(fork.get_entry(b"note"), b"parent")
+
+        snapshot = t.snapshot()
+        t.update(b"horse", b"stallion")
+        fork.update(b"cat", b"lion")
+        fork.delete(b"dog")
+        fork.put_entry(b"note", b"fork")
+        self.assertEqual(fork.get_value(b"horse"), b"")
+        self.assertEqual(fork.get_value(b"cat"), b"lion")
+        self.assertEqual(t.get_value(b"cat"), b"kitten")
+        self.assertEqual(t.get_value(b"dog"), b"puppy")
+        self.assertEqual(t.get_entry(b"note"), b"parent")
+        t.revert(snapshot)
+        self.assertEqual(t.get_value(b"horse"), b"")
+
+        # a pending entry of a shared map is only dropped for the trie that drops it
+        t._invalidate_flat()
+        self.assertEqual(t.get_value(b"cat"), b"kitten")
+        self.assertEqual(fork.get_value(b"cat"), b"lion")
+        self.assertEqual(fork.get_value(b"dog"), b"")
+
+        fork.commit()
+        self.assertEqual(t.db.get(b"note"), b"fork")
+        self.assertEqual(t.get_entry(b"note"), b"parent")
+        t.commit()
+        self.assertEqual(t.db.get(b"note"), b"parent")
+        self.assertEqual(
+            dict(Trie(t.db, t.root_hash).items()), {b"dog": b"puppy", b"cat": b"kitten"}
+        )
+        self.assertEqual(dict(Trie(fork.db, fork.root_hash).items()), {b"cat": b"lion"})
@@ -0,0 +1,100 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from mpt import db
+from mpt.codec import decode_node
+from mpt.frozen import FrozenTrie, freeze
+from mpt.proof import verify_proof
+from mpt.trie import BLANK_ROOT_HASH, Trie
+
+
+class FrozenTrieTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(25)
+        self.store = db.MemoryDB()
+        self.trie = Trie(self.store, write_back=True)
+        self.items = {}
+        for _ in range(400):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 33)))
+            self.items[key] = bytes(
+                rnd.randrange(256) for _ in range(rnd.randrange(1, 80))
+            )
+        # short keys and values give inline nodes, values are also stored in branch nodes
+        for i in range(30):
+            self.items[bytes([0xAB, i])] = bytes([i])
+        self.items[b"\xab"] = b"branch value"
+        # identical subtrees below different paths
+        for prefix in (b"\x00\x00", b"\x10\x00"):
+            for i in range(20):
+                self.items[prefix + bytes([i])] = b"shared" * 8
+        for key, value in self.items.items():
+            self.trie.update(key, value)
+        self.root = self.trie.get_root_hash()
+        self.trie.commit()
+
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_getValue(self):
+        freeze(self.store, self.root, self.filename)
+        with FrozenTrie(self.filename) as frozen:
+            self.assertEqual(frozen.root_hash, self.root)
+            for key, value in self.items.items():
+                self.assertEqual(frozen.get_value(key), value)
+            for key in (b"\xab\xff", b"\x00", b"\x00\x00\x01\x02", b"absent" * 5):
+                self.assertEqual(frozen.get_value(key), self.items.get(key, b""))
+
+    def test_getProof(self):
+        freeze(self.store, self.root, self.filename)
+        with FrozenTrie(self.filename) as frozen:
+            keys = list(self.items)[:100] + [b"\xab\xff", b"absent", b"\x00\x00"]
+            for key in keys:
+                proof = frozen.get_proof(key)
+                self.assertEqual(proof, self.trie.get_proof(key))
+                self.assertEqual(
+                    verify_proof(self.root, key, proof), self.items.get(key, b"")
+                )
+
+    def test_sharedSubtrees(self):
+        stats = freeze(self.store, self.root, self.filename)
+        self.assertEqual(stats.bytes, os.path.getsize(self.filename))
+        # one record per distinct stored node, plus one per inline node of those
+        seen = set()
+        records = 0
+        stack = [self.root]
+        while stack:
+            hash_key = stack.pop()
+            if hash_key in seen:
+                continue
+            seen.add(hash_key)
+            nodes = [decode_node(self.store.get(hash_key))]
+            while nodes:
+                records += 1
+                for ref in Trie._child_refs(nodes.pop()):
+                    if isinstance(ref, list):
+                        nodes.append(ref)
+                    else:
+                        stack.append(ref)
+        self.assertEqual(stats.nodes, records)
+
+    def test_blankRoot(self):
+        freeze(db.MemoryDB(), BLANK_ROOT_HASH, self.filename)
+        with FrozenTrie(self.filename) as frozen:
+            self.assertEqual(frozen.get_value(b"abcd"), b"")
+            proof = frozen.get_proof(b"abcd")
+            self.assertEqual(verify_proof(BLANK_ROOT_HASH, b"abcd", proof), b"")
+
+    def test_missingNode(self):
+        with self.assertRaises(Exception):
+            freeze(db.MemoryDB(), self.root, self.filename)
+
+    def test_invalidFile(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"\x00" * 48)
+        with self.assertRaises(Exception):
+            FrozenTrie(self.filename)
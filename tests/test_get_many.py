@@ -0,0 +1,47 @@
+import random
+from unittest import TestCase
+
+from mpt.trie import Trie
+from tests import CountingDB
+
+
+class GetManyTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(11)
+        self.store = CountingDB()
+        t = Trie(self.store)
+        self.items = {}
+        for _ in range(1000):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 33)))
+            self.items[key] = b"value" * rnd.randrange(1, 10)
+            t.update(key, self.items[key])
+        t.commit()
+        self.root = t.root_hash
+
+    def test_inputOrder(self):
+        t = Trie(self.store, self.root)
+        keys = list(self.items)
+        keys.reverse()
+        keys += [b"", b"missing", keys[0], keys[0][:-1]]
+        self.assertEqual(t.get_many(keys), [t.get_value(key) or b"" for key in keys])
+        self.assertEqual(t.get_many([]), [])
+
+    def test_oneMultiGetPerLevel(self):
+        t = Trie(self.store, self.root)
+        self.store.gets = self.store.multi_gets = 0
+        self.assertEqual(t.get_many(list(self.items)), list(self.items.values()))
+        self.assertEqual(self.store.gets, 0)
+        self.assertLessEqual(self.store.multi_gets, 10)
+
+    def test_flatLayer(self):
+        t = Trie(self.store, self.root, flat=True)
+        t.regenerate_flat()
+        t.update(b"new", b"value")
+        t.delete(list(self.items)[0])
+        self.store.multi_gets = 0
+        keys = list(self.items)[:3] + [b"new", b"missing"]
+        self.assertEqual(
+            t.get_many(keys),
+            [b"", self.items[keys[1]], self.items[keys[2]], b"value", b""],
+        )
+        self.assertEqual(self.store.multi_gets, 1)
@@ -0,0 +1,66 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import Trie
+from tests import CountingDB
+
+
+class IterationTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        self.db = CountingDB()
+        self.trie = Trie(self.db)
+        self.items = {}
+        for _ in range(400):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 4)))
+            self.items[key] = b"v" * rnd.randrange(1, 40)
+        for key in [b"do", b"dog", b"doge", b"dogs", b"\xff", b"\xff\xff"]:
+            self.items[key] = key * 10
+        for key, value in self.items.items():
+            self.trie.update(key, value)
+
+    def test_items(self):
+        self.assertEqual(list(self.trie.items()), sorted(self.items.items()))
+        self.assertEqual(list(self.trie.keys()), sorted(self.items))
+        self.assertEqual(
+            list(self.trie.values()), [v for _, v in sorted(self.items.items())]
+        )
+
+    def test_range(self):
+        for start, end in [
+            (b"do", b"dogs"),
+            (b"\x10", b"\x10\x80"),
+            (None, b"\x05"),
+            (b"\xf0", None),
+            (b"b", b"a"),
+        ]:
+            expected = [
+                (k, v)
+                for k, v in sorted(self.items.items())
+                if (start is None or k >= start) and (end is None or k < end)
+            ]
+            self.assertEqual(list(self.trie.items(start, end)), expected)
+
+    def test_prefix(self):
+        for prefix in [b"do", b"\xff", b"\x42", b"zzz"]:
+            expected = [
+                (k, v) for k, v in sorted(self.items.items()) if k.startswith(prefix)
+            ]
+            self.assertEqual(list(self.trie.items(prefix=prefix)), expected)
+            self.assertEqual(
+                list(self.trie.items(prefix=prefix, read_ahead=True)), expected
+            )
+
+    def test_lazy(self):
+        self.db.reads = 0
+        items = self.trie.items()
+        next(items)
+        next(items)
+        first_reads = self.db.reads
+        self.assertLess(first_reads, 10)
+        list(items)
+        self.assertGreater(self.db.reads, first_reads)
+
+    def test_emptyTrie(self):
+        self.assertEqual(list(Trie(db.MemoryDB()).items()), [])
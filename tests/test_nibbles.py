@@ -0,0 +1,64 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import (
+    Trie,
+    bin_to_nibbles,
+    common_prefix_length,
+    pack_nibble_range,
+    pack_nibbles,
+    path_range,
+    unpack_to_nibbles,
+)
+
+
+class NibbleRangeTest(TestCase):
+    def test_packNibbleRange(self):
+        data = bytes.fromhex("0123456789abcdef")
+        nibbles = bin_to_nibbles(data)
+        for start in range(len(nibbles) + 1):
+            for end in range(start, len(nibbles) + 1):
+                for terminator in (True, False):
+                    self.assertEqual(
+                        pack_nibble_range(data, start, end, terminator),
+                        pack_nibbles(nibbles[start:end], terminator),
+                    )
+
+    def test_pathRange(self):
+        for nibbles in ([], [1], [1, 2], [1, 2, 3]):
+            packed = pack_nibbles(nibbles, True)
+            start, end = path_range(packed)
+            self.assertEqual(bin_to_nibbles(packed)[start:end], nibbles)
+            self.assertEqual(unpack_to_nibbles(packed), nibbles)
+
+    def test_commonPrefixLength(self):
+        a = bytes.fromhex("123456")
+        b = bytes.fromhex("1234ff")
+        self.assertEqual(common_prefix_length(a, 0, 6, b, 0, 6), 4)
+        self.assertEqual(common_prefix_length(a, 1, 6, b, 1, 3), 2)
+        self.assertEqual(common_prefix_length(a, 4, 6, b, 0, 6), 0)
+
+
+class RandomOperationsTest(TestCase):
+    def test_matchesDict(self):
+        rnd = random.Random(7)
+        t = Trie(db.MemoryDB())
+        expected = {}
+        for _ in range(2000):
+            key = bytes(rnd.randrange(3) for _ in range(rnd.randrange(1, 5)))
+            if rnd.random() < 0.3:
+                t.delete(key)
+                expected.pop(key, None)
+            else:
+                value = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 40)))
+                t.update(key, value)
+                expected[key] = value
+
+        for key, value in expected.items():
+            self.assertEqual(t.get_value(key), value)
+
+        fresh = Trie(db.MemoryDB())
+        for key, value in expected.items():
+            fresh.update(key, value)
+        self.assertEqual(t.get_root_hash(), fresh.get_root_hash())
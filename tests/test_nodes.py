@@ -0,0 +1,107 @@
+from unittest import TestCase
+
+import rlp
+from mpt.proof import verify_proof
+from mpt.trie import (
+    BRANCH,
+    BranchNode,
+    ExtensionNode,
+    LeafNode,
+    Node,
+    Trie,
+    get_node_type,
+    make_node,
+    node_hash,
+)
+from mpt.utils import sha3
+from tests import CountingDB
+
+
+class NodeClassTest(TestCase):
+    def setUp(self):
+        self.store = CountingDB()
+        t = Trie(self.store)
+        for i in range(16):
+            t.update(bytes([i, 0, i]), b"value" * 8)
+        t.update(b"\x40", b"value" * 8)
+        t.commit()
+        self.root = t.root_hash
+
+    def test_decodedNodes(self):
+        t = Trie(self.store, self.root)
+        self.assertIsInstance(t.root_node, BranchNode)
+        self.assertEqual(t.root_node.hash, self.root)
+        self.assertFalse(t.root_node.dirty)
+        # a stored node does not keep its encoding
+        self.assertIsNone(t.root_node.rlp)
+        self.assertEqual(rlp.encode(t.root_node), t._rlp_root())
+        self.assertEqual(get_node_type(t.root_node), BRANCH)
+        self.assertFalse(hasattr(t.root_node, "__dict__"))
+
+        child = t._decode_to_node(t.root_node[0])
+        self.assertIsInstance(child, (LeafNode, ExtensionNode, BranchNode))
+        copy = t.root_node[:]
+        self.assertIs(type(copy), list)
+        self.assertEqual(copy, t.root_node)
+
+    def test_makeNode(self):
+        leaf = [b"\x20\x12", b"value"]
+        node = make_node(leaf, rlp.encode(leaf))
+        self.assertIsInstance(node, LeafNode)
+        self.assertIsInstance(node, Node)
+        self.assertEqual(node_hash(node), sha3(rlp.encode(leaf)))
+        self.assertIsInstance(make_node([b"\x00\x12", b"h" * 32], b""), ExtensionNode)
+
+    def test_unchangedNodesAreNotStoredAgain(self):
+        t = Trie(self.store, self.root)
+        self.store.puts = 0
+        self.assertEqual(t.get_root_hash(), self.root)
+        self.assertEqual(t._encode_node(t.root_node), (self.root, 0))
+        # removing a sibling turns the branch into an extension to the unchanged branch below
+        t.delete(b"\x40")
+        self.assertIsInstance(t.root_node, list)
+        self.assertEqual(len(t.root_node), 2)
+        root = t.get_root_hash()
+        # only the new root is stored
+        self.assertEqual(self.store.puts, 1)
+        self.assertIsNotNone(self.store.get(root))
+
+    def test_rootIsEncodedOnce(self):
+        t = Trie(self.store, self.root)
+        t.update(b"new", b"value")
+        self.assertEqual(len(t._typed_root()), 17)
+        node = t.root_node
+        self.assertIsInstance(node, Node)
+        self.assertTrue(node.dirty)
+        root = t.get_root_hash()
+        self.assertIs(t.root_node, node)
+        # the write-through trie stores the root together with its hash
+        self.assertFalse(node.dirty)
+        self.store.puts = 0
+        self.assertEqual(t.get_root_hash(), root)
+        self.assertEqual(self.store.puts, 0)
+        self.assertEqual(Trie(self.store, root).get_value(b"new"), b"value")
+
+    def test_nodesAreImmutable(self):
+        t = Trie(self.store, self.root)
+        with self.assertRaises(TypeError):
+            t.root_node[0] = b""
+        with self.assertRaises(TypeError):
+            t.root_node.append(b"")
+        copy = t.root_node[:]
+        copy[0] = b""
+        self.assertNotEqual(t.root_node[0], b"")
+
+    def test_proofsOfStoredNodes(self):
+        for cache_size in (0, 1 << 16):
+            t = Trie(self.store, self.root, cache_size=cache_size)
+            key = bytes([3, 0, 3])
+            self.assertEqual(t.get_value(key), b"value" * 8)
+            self.assertEqual(
+                verify_proof(self.root, key, t.get_proof(key)), b"value" * 8
+            )
+            t.update(b"new", b"value")
+            t.commit()
+            self.assertEqual(
+                verify_proof(t.root_hash, key, t.get_proof(key)), b"value" * 8
+            )
@@ -0,0 +1,178 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.proof import (
+    ProofError,
+    verify_multiproof,
+    verify_proof,
+    verify_range_proof,
+)
+from mpt.trie import Trie
+
+
+class ProofTest(TestCase):
+    def setUp(self):
+        self.trie = Trie(db.MemoryDB())
+        self.items = {
+            b"do": b"verb",
+            b"dog": b"puppy",
+            b"doge": b"coin",
+            b"horse": b"stallion",
+            b"key1aa": b"0123456789012345678901234567890123456789xxx",
+            b"key1": b"0123456789012345678901234567890123456789Very_Long",
+            b"key2bb": b"aval3",
+            b"key2": b"short",
+        }
+        for key, value in self.items.items():
+            self.trie.update(key, value)
+        self.root = self.trie.get_root_hash()
+
+    def test_inclusion(self):
+        for key, value in self.items.items():
+            proof = self.trie.get_proof(key)
+            self.assertEqual(verify_proof(self.root, key, proof), value)
+
+    def test_exclusion(self):
+        for key in [b"d", b"dogs", b"key", b"key3", b"zebra", b"key2b"]:
+            proof = self.trie.get_proof(key)
+            self.assertEqual(verify_proof(self.root, key, proof), b"")
+
+    def test_inlineNodesAreNotListed(self):
+        # b"do", b"dog" and b"doge" end up in small nodes embedded in their parents
+        proof = self.trie.get_proof(b"doge")
+        self.assertTrue(all(len(node) >= 32 for node in proof[1:]))
+
+    def test_missingNode(self):
+        proof = self.trie.get_proof(b"key1aa")
+        with self.assertRaises(ProofError):
+            verify_proof(self.root, b"key1aa", proof[:-1])
+
+    def test_wrongRoot(self):
+        proof = self.trie.get_proof(b"horse")
+        self.trie.update(b"horse", b"pony")
+        with self.assertRaises(ProofError):
+            verify_proof(self.trie.get_root_hash(), b"horse", proof)
+
+
+class MultiproofTest(TestCase):
+    def setUp(self):
+        self.trie = Trie(db.MemoryDB())
+        self.items = {}
+        for i in range(300):
+            key = i.to_bytes(2, "big") * 2
+            self.items[key] = b"value %d" % i + b"." * 20
+            self.trie.update(key, self.items[key])
+        self.root = self.trie.get_root_hash()
+
+    def test_multiproof(self):
+        keys = list(self.items)[::7] + [b"\xff\xff", b"\x00", b"\x00\x01\x00"]
+        proof = self.trie.get_multiproof(keys)
+        self.assertEqual(len(proof), len(set(proof)))
+        self.assertEqual(
+            verify_multiproof(self.root, keys, proof),
+            [self.items.get(key, b"") for key in keys],
+        )
+
+    def test_smallerThanSingleProofs(self):
+        keys = list(self.items)[::3]
+        proof = self.trie.get_multiproof(keys)
+        single = set()
+        for key in keys:
+            single.update(self.trie.get_proof(key))
+        self.assertEqual(set(proof), single)
+        self.assertLess(len(proof), sum(len(self.trie.get_proof(key)) for key in keys))
+
+    def test_missingNode(self):
+        keys = list(self.items)[:10]
+        proof = self.trie.get_multiproof(keys)
+        with self.assertRaises(ProofError):
+            verify_multiproof(self.root, keys, proof[:-1])
+
+
+class RangeProofTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(11)
+        self.trie = Trie(db.MemoryDB())
+        self.items = {}
+        for _ in range(300):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 4)))
+            self.items[key] = b"value" * rnd.randrange(1, 8)
+        for key in [b"do", b"dog", b"doge", b"dogs"]:
+            self.items[key] = key
+        for key, value in self.items.items():
+            self.trie.update(key, value)
+        self.root = self.trie.get_root_hash()
+        self.sorted_keys = sorted(self.items)
+
+    def test_ranges(self):
+        for start, count in [
+            (b"\x00", 10),
+            (b"do", 3),
+            (b"dog", 1),
+            (b"\x80", 50),
+            (self.sorted_keys[-5], 10),
+            (b"\x00", 1000),
+            (b"\x10\x00\x00", 7),
+        ]:
+            keys, values, proof = self.trie.get_range(start, max_count=count)
+            expected = [k for k in self.sorted_keys if k >= start][:count]
+            self.assertEqual(keys, expected)
+            has_more = verify_range_proof(self.root, start, keys, values, proof)
+            self.assertEqual(has_more, keys[-1] != self.sorted_keys[-1])
+
+    def test_maxBytes(self):
+        keys, values, proof = self.trie.get_range(b"\x40", max_bytes=100)
+        self.assertGreater(len(keys), 1)
+        self.assertLess(sum(map(len, keys + values[:-1])), 100 + len(keys[-1]))
+        self.assertTrue(verify_range_proof(self.root, b"\x40", keys, values, proof))
+
+    def test_missingKey(self):
+        keys, values, proof = self.trie.get_range(b"\x20", max_count=20)
+        with self.assertRaises(ProofError):
+            verify_range_proof(
+                self.root, b"\x20", keys[:5] + keys[6:], values[:5] + values[6:], proof
+            )
+        with self.assertRaises(ProofError):
+            verify_range_proof(self.root, b"\x20", keys[1:], values[1:], proof)
+
+    def test_modifiedValue(self):
+        keys, values, proof = self.trie.get_range(b"\x20", max_count=20)
+        values[3] = b"forged"
+        with self.assertRaises(ProofError):
+            verify_range_proof(self.root, b"\x20", keys, values, proof)
+
+    def test_emptyRange(self):
+        keys, values, proof = self.trie.get_range(b"\xff\xff\xff")
+        self.assertEqual(keys, [])
+        self.assertFalse(verify_range_proof(self.root, b"\xff\xff\xff", [], [], proof))
+
+        keys, values, proof = self.trie.get_range(b"\x20")
+        with self.assertRaises(ProofError):
+            verify_range_proof(self.root, b"\x20", [], [], proof)
+
+    def test_wholeTrieWithoutProof(self):
+        keys = self.sorted_keys
+        values = [self.items[key] for key in keys]
+        self.assertFalse(verify_range_proof(self.root, b"", keys, values, []))
+        with self.assertRaises(ProofError):
+            verify_range_proof(self.root, b"", keys[1:], values[1:], [])
+
+    def test_emptyValues(self):
+        t = Trie(db.MemoryDB())
+        for key, value in [(b"a", b"1"), (b"b", b""), (b"c", b"3"), (b"d", b"")]:
+            t.update(key, value)
+        t.update(b"\xff" * 3, b"value" * 8)
+        root = t.get_root_hash()
+        for start, count in [(b"a", 2), (b"a", None), (b"b", 1), (b"", None)]:
+            keys, values, proof = t.get_range(start, max_count=count)
+            self.assertIn(b"", values)
+            verify_range_proof(root, start, keys, values, proof)
+
+        keys, values, proof = t.get_range(b"a")
+        values[1] = b"forged"
+        with self.assertRaises(ProofError):
+            verify_range_proof(root, b"a", keys, values, proof)
+        keys = list(t.keys())
+        values = [t.get_value(key) for key in keys]
+        self.assertFalse(verify_range_proof(root, b"", keys, values, []))
@@ -0,0 +1,88 @@
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.trie import FLAT_PREFIX, Trie
+
+
+class PruneTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(21)
+        self.store = db.MemoryDB()
+        self.items = {}
+        for _ in range(300):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 6)))
+            self.items[key] = bytes(rnd.randrange(256) for _ in range(40))
+
+    def _fill(self, t: Trie, items: dict) -> bytes:
+        for key, value in items.items():
+            t.update(key, value)
+        t.commit()
+        return t.root_hash
+
+    def _node_count(self) -> int:
+        return sum(1 for key, _ in self.store.iterate_prefix() if len(key) == 32)
+
+    def _assert_contains(self, root: bytes, items: dict):
+        t = Trie(self.store, root)
+        self.assertEqual(dict(t.items()), items)
+
+    def test_pruneOldRoots(self):
+        t = Trie(self.store)
+        old_root = self._fill(t, self.items)
+        changed = {key: b"changed" * 6 for key in list(self.items)[:100]}
+        new_root = self._fill(t, changed)
+        before = self._node_count()
+
+        deleted = t.prune()
+        self.assertGreater(deleted, 0)
+        self.assertEqual(self._node_count(), before - deleted)
+        self._assert_contains(new_root, {**self.items, **changed})
+        with self.assertRaises(Exception):
+            Trie(self.store, old_root)
+
+        # the same trie built from scratch has exactly the remaining nodes
+        fresh = db.MemoryDB()
+        self._fill(Trie(fresh, write_back=True), {**self.items, **changed})
+        self.assertEqual(self._node_count(), len(fresh))
+
+    def test_keepRoots(self):
+        t = Trie(self.store)
+        old_root = self._fill(t, self.items)
+        self._fill(t, {key: b"changed" * 6 for key in self.items})
+        t.prune(keep_roots=[old_root], batch_size=3)
+        self._assert_contains(old_root, self.items)
+
+    def test_openReadersAreKept(self):
+        t = Trie(self.store)
+        old_root = self._fill(t, self.items)
+        reader = Trie(self.store, old_root)
+        self._fill(t, {key: b"changed" * 6 for key in self.items})
+        t.prune()
+        self.assertEqual(dict(reader.items()), self.items)
+
+        del reader
+        t.prune()
+        with self.assertRaises(Exception):
+            Trie(self.store, old_root)
+
+    def test_uncommittedNodesAreKept(self):
+        t = Trie(self.store)
+        self._fill(t, self.items)
+        for key in list(self.items)[:50]:
+            t.delete(key)
+        t.prune()
+        root = t.get_root_hash()
+        t.commit()
+        self._assert_contains(root, dict(list(self.items.items())[50:]))
+
+    def test_entriesAreKept(self):
+        t = Trie(self.store, flat=True)
+        t.update(b"a" * 27, b"value")
+        t.put_entry(b"preimage", b"data")
+        t.commit()
+        t.update(b"a" * 27, b"other")
+        t.commit()
+        t.prune()
+        self.assertEqual(self.store.get(FLAT_PREFIX + b"a" * 27), b"other")
+        self.assertEqual(t.get_entry(b"preimage"), b"data")
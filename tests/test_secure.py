@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from mpt import db
+from mpt.proof import verify_proof
+from mpt.secure import PREIMAGE_PREFIX, SecureTrie
+from mpt.trie import Trie
+from sha3 import keccak_256
+
+
+class SecureTrieTest(TestCase):
+    def test_emptyValue(self):
+        t = SecureTrie(db.MemoryDB())
+        for key, value in [
+            [b"do", b"verb"],
+            [b"ether", b"wookiedoo"],
+            [b"horse", b"stallion"],
+            [b"shaman", b"horse"],
+            [b"doge", b"coin"],
+            [b"ether", b""],
+            [b"dog", b"puppy"],
+            [b"shaman", b""],
+        ]:
+            t.update(key, value)
+        self.assertEqual(
+            t.get_root_hash().hex(),
+            "29b235a58c3c25ab83010c327d5932bcf05324b7d6b1185e650798034783ca9d",
+        )
+        self.assertEqual(t.get_value(b"doge"), b"coin")
+        self.assertFalse(t.get_value(b"ether"))
+
+    def test_sameRootAsHashedKeys(self):
+        items = [(bytes([i]) * (i % 40 + 1), b"value %d" % i) for i in range(100)]
+        plain = Trie(db.MemoryDB())
+        for key, value in items:
+            plain.update(keccak_256(key).digest(), value)
+
+        t = SecureTrie(db.MemoryDB())
+        t.update_many(items)
+        self.assertEqual(t.get_root_hash(), plain.get_root_hash())
+        self.assertEqual(
+            t.get_many([key for key, _ in items]), [value for _, value in items]
+        )
+
+        t.delete(items[0][0])
+        plain.delete(keccak_256(items[0][0]).digest())
+        self.assertEqual(t.get_root_hash(), plain.get_root_hash())
+
+    def test_keyCache(self):
+        t = SecureTrie(db.MemoryDB(), key_cache_size=2)
+        t.update(b"a", b"1")
+        self.assertEqual(t.get_value(b"a"), b"1")
+        self.assertEqual(t.key_cache.hits, 1)
+
+        t = SecureTrie(db.MemoryDB(), key_cache_size=0)
+        t.update(b"a", b"1")
+        self.assertEqual(t.get_value(b"a"), b"1")
+
+    def test_preimages(self):
+        store = db.MemoryDB()
+        t = SecureTrie(store, preimages=True, write_back=True)
+        keys = [b"do", b"dog", b"doge", b"horse", b"a" * 50]
+        for key in keys:
+            t.update(key, key + b" value")
+        self.assertEqual(len(store), 0)
+
+        root = t.get_root_hash()
+        self.assertEqual(
+            store.get(PREIMAGE_PREFIX + keccak_256(b"doge").digest()), b"doge"
+        )
+        t = SecureTrie(store, root, preimages=True)
+        self.assertEqual(
+            sorted(t.items()), sorted((key, key + b" value") for key in keys)
+        )
+
+        with self.assertRaises(Exception):
+            list(SecureTrie(store, root).items())
+
+    def test_proof(self):
+        t = SecureTrie(db.MemoryDB())
+        t.update(b"horse", b"stallion" * 8)
+        t.update(b"dog", b"puppy" * 8)
+        root = t.get_root_hash()
+        self.assertEqual(
+            verify_proof(root, keccak_256(b"dog").digest(), t.get_proof(b"dog")),
+            b"puppy" * 8,
+        )
@@ -0,0 +1,118 @@
+from unittest import TestCase
+
+from mpt import db
+from mpt.secure import PREIMAGE_PREFIX, SecureTrie
+from mpt.trie import Trie
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.t = Trie(db.MemoryDB(), write_back=True)
+        for i in range(50):
+            self.t.update(bytes([i]) * 3, b"value" * 10)
+        self.root = self.t.get_root_hash()
+
+    def test_revert(self):
+        snapshot = self.t.snapshot()
+        self.t.update(b"\x01" * 3, b"changed")
+        self.t.delete(b"\x02" * 3)
+        self.t.update(b"new", b"value")
+        self.t.revert(snapshot)
+        self.assertEqual(self.t.get_root_hash(), self.root)
+        self.assertEqual(self.t.get_value(b"\x02" * 3), b"value" * 10)
+        self.assertFalse(self.t.get_value(b"new"))
+
+    def test_nested(self):
+        outer = self.t.snapshot()
+        self.t.update(b"a", b"1")
+        inner = self.t.snapshot()
+        self.t.update(b"b", b"2")
+        self.t.revert(inner)
+        self.assertEqual(self.t.get_value(b"a"), b"1")
+        self.assertFalse(self.t.get_value(b"b"))
+
+        inner = self.t.snapshot()
+        self.t.update(b"c", b"3")
+        self.t.discard(inner)
+        self.assertEqual(self.t.get_value(b"c"), b"3")
+        with self.assertRaises(Exception):
+            self.t.revert(inner)
+
+        self.t.revert(outer)
+        self.assertEqual(self.t.get_root_hash(), self.root)
+
+    def test_revertClosesInnerSnapshots(self):
+        outer = self.t.snapshot()
+        self.t.update(b"a", b"1")
+        self.t.snapshot()
+        self.t.update(b"b", b"2")
+        self.t.revert(outer)
+        self.assertEqual(self.t.get_root_hash(), self.root)
+        with self.assertRaises(Exception):
+            self.t.revert(1)
+
+    def test_commitDiscardsSnapshots(self):
+        snapshot = self.t.snapshot()
+        self.t.update(b"a", b"1")
+        self.t.commit()
+        with self.assertRaises(Exception):
+            self.t.revert(snapshot)
+
+    def test_rootHashKeepsSnapshots(self):
+        snapshot = self.t.snapshot()
+        self.t.update(b"a", b"1")
+        root = self.t.get_root_hash()
+        self.t.update(b"b", b"2")
+        self.t.revert(snapshot)
+        self.assertEqual(self.t.get_root_hash(), self.root)
+
+        other = Trie(db.MemoryDB())
+        for key, value in list(self.t.items()) + [(b"a", b"1")]:
+            other.update(key, value)
+        self.assertEqual(other.get_root_hash(), root)
+
+    def test_pruneKeepsSnapshotRoots(self):
+        t = Trie(db.MemoryDB())
+        items = {bytes([i]) * 3: b"value" * 10 for i in range(50)}
+        for key, value in items.items():
+            t.update(key, value)
+        t.get_root_hash()
+
+        outer = t.snapshot()
+        for i in range(0, 50, 2):
+            t.update(bytes([i]) * 3, b"changed" * 10)
+        t.get_root_hash()
+        inner = t.snapshot()
+        for i in range(1, 50, 2):
+            t.delete(bytes([i]) * 3)
+        fork = t.fork()
+        fork_snapshot = fork.snapshot()
+        fork.update(b"fork", b"value" * 10)
+        self.assertGreater(t.prune(), 0)
+
+        fork.revert(fork_snapshot)
+        self.assertFalse(fork.get_value(b"fork"))
+        self.assertEqual(fork.get_value(b"\x02" * 3), b"changed" * 10)
+        t.revert(inner)
+        self.assertEqual(t.get_value(b"\x01" * 3), b"value" * 10)
+        self.assertEqual(t.get_value(b"\x02" * 3), b"changed" * 10)
+        t.revert(outer)
+        self.assertEqual(dict(t.items()), items)
+
+    def test_pendingEntries(self):
+        t = SecureTrie(db.MemoryDB(), preimages=True, write_back=True, flat=True)
+        t.update(b"dog", b"puppy")
+        outer = t.snapshot()
+        t.update(b"dog", b"wolf")
+        inner = t.snapshot()
+        t.update(b"horse", b"stallion")
+        t.discard(inner)
+        self.assertEqual(t.get_value(b"horse"), b"stallion")
+        t.revert(outer)
+
+        self.assertEqual(t.get_value(b"dog"), b"puppy")
+        self.assertFalse(t.get_value(b"horse"))
+        t.commit()
+        self.assertEqual(list(t.items()), [(b"dog", b"puppy")])
+        hashed = t.hash_key(b"horse")
+        self.assertIsNone(t.trie.db.get(PREIMAGE_PREFIX + hashed))
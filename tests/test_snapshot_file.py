@@ -0,0 +1,116 @@
+import io
+import random
+from unittest import TestCase
+
+from mpt import db
+from mpt.codec import decode_node
+from mpt.snapshot import (
+    SnapshotError,
+    _hashed_children,
+    export_snapshot,
+    import_snapshot,
+    read_index,
+    read_node,
+)
+from mpt.sync import TrieSync, db_source
+from mpt.trie import Trie
+from mpt.utils import sha3
+
+
+class SnapshotFileTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(6)
+        self.store = db.MemoryDB()
+        t = Trie(self.store, write_back=True)
+        self.items = {}
+        for _ in range(400):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 33)))
+            self.items[key] = bytes(
+                rnd.randrange(256) for _ in range(rnd.randrange(1, 80))
+            )
+            t.update(key, self.items[key])
+        # identical subtrees below different paths
+        for prefix in (b"\x00\x00", b"\x10\x00"):
+            for i in range(20):
+                self.items[prefix + bytes([i])] = b"shared" * 8
+                t.update(prefix + bytes([i]), b"shared" * 8)
+        self.root = t.get_root_hash()
+        # nodes of an older root are not part of the snapshot
+        t.update(b"old", b"value" * 10)
+        t.commit()
+
+    def _export(self, **kwargs) -> io.BytesIO:
+        fileobj = io.BytesIO()
+        export_snapshot(self.store, self.root, fileobj, **kwargs)
+        fileobj.seek(0)
+        return fileobj
+
+    def test_roundTrip(self):
+        for index in (False, True):
+            target = db.MemoryDB()
+            root = import_snapshot(target, self._export(index=index), batch_size=16)
+            self.assertEqual(root, self.root)
+            self.assertEqual(dict(Trie(target, root).items()), self.items)
+            self.assertNotIn(b"old", dict(Trie(target, root).items()))
+
+    def test_stats(self):
+        fileobj = io.BytesIO()
+        plain = export_snapshot(self.store, self.root, fileobj)
+        deduplicated = export_snapshot(self.store, self.root, io.BytesIO(), index=True)
+        self.assertGreater(plain.nodes, deduplicated.nodes)
+        self.assertLess(plain.bytes, len(fileobj.getvalue()))
+
+    def test_index(self):
+        fileobj = self._export(index=True)
+        index = read_index(fileobj)
+        self.assertIn(self.root, index)
+        for hash_key, offset in index.items():
+            self.assertEqual(sha3(read_node(fileobj, offset)), hash_key)
+
+    def test_corruptSnapshot(self):
+        data = self._export().getvalue()
+        for corrupt in (
+            b"X" + data[1:],
+            data[:-1],
+            data[:100],
+            data[:60] + bytes([data[60] ^ 1]) + data[61:],
+        ):
+            with self.assertRaises(SnapshotError):
+                import_snapshot(db.MemoryDB(), io.BytesIO(corrupt))
+
+    def test_truncatedImport(self):
+        for index in (False, True):
+            data = self._export(index=index).getvalue()
+            target = db.MemoryDB()
+            with self.assertRaises(SnapshotError):
+                import_snapshot(
+                    target, io.BytesIO(data[: len(data) // 2]), batch_size=10
+                )
+            self.assertIsNone(target.get(self.root))
+            # every stored node has its complete subtree
+            stored = [key for key, _ in target.iterate_prefix()]
+            self.assertTrue(stored)
+            for hash_key in stored:
+                stack = [hash_key]
+                while stack:
+                    rlp_node = target.get(stack.pop())
+                    self.assertIsNotNone(rlp_node)
+                    stack.extend(_hashed_children(decode_node(rlp_node)))
+
+            stats = TrieSync(target, self.root, db_source(self.store)).run()
+            self.assertGreater(stats.nodes, 0)
+            self.assertEqual(dict(Trie(target, self.root).items()), self.items)
+
+            # a second import completes what is left
+            target = db.MemoryDB()
+            with self.assertRaises(SnapshotError):
+                import_snapshot(target, io.BytesIO(data[: len(data) // 3]))
+            self.assertEqual(import_snapshot(target, io.BytesIO(data)), self.root)
+            self.assertEqual(dict(Trie(target, self.root).items()), self.items)
+
+    def test_missingNode(self):
+        store = db.MemoryDB()
+        store.write_batch(self.store.iterate_prefix())
+        store.delete(next(key for key, _ in store.iterate_prefix() if key != self.root))
+        with self.assertRaises(SnapshotError):
+            export_snapshot(store, self.root, io.BytesIO())
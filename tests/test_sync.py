@@ -0,0 +1,92 @@
+import random
+import threading
+from unittest import TestCase
+
+from mpt import db
+from mpt.sync import TrieSync, db_source
+from mpt.trie import Trie
+
+
+class SyncTest(TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        self.source = db.MemoryDB()
+        t = Trie(self.source, write_back=True)
+        self.items = {}
+        for _ in range(500):
+            key = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 6)))
+            self.items[key] = bytes(
+                rnd.randrange(256) for _ in range(rnd.randrange(1, 40))
+            )
+            t.update(key, self.items[key])
+        # the same subtree under several paths
+        for prefix in (b"\x00\x00", b"\x10\x00"):
+            for i in range(20):
+                self.items[prefix + bytes([i])] = b"shared" * 8
+                t.update(prefix + bytes([i]), b"shared" * 8)
+        self.root = t.get_root_hash()
+
+    def test_sync(self):
+        store = db.MemoryDB()
+        stats = TrieSync(
+            store, self.root, db_source(self.source), batch_size=16, max_in_flight=3
+        ).run()
+        self.assertEqual(dict(Trie(store, self.root).items()), self.items)
+        self.assertEqual(stats.nodes, len(self.source))
+        self.assertEqual(len(store), len(self.source))
+        self.assertEqual((stats.queued, stats.in_flight, stats.invalid), (0, 0, 0))
+        self.assertGreater(stats.requests, len(self.source) // 16)
+
+        # everything is stored already
+        stats = TrieSync(store, self.root, db_source(self.source)).run()
+        self.assertEqual((stats.nodes, stats.requests), (0, 0))
+
+    def test_invalidResponsesAreRetried(self):
+        lock = threading.Lock()
+        corrupted = set()
+
+        def fetch(hashes):
+            nodes = self.source.multi_get(hashes)
+            with lock:
+                for i, hash_key in enumerate(hashes):
+                    if hash_key not in corrupted:
+                        corrupted.add(hash_key)
+                        nodes[i] = None if i % 2 else nodes[i] + b"x"
+            return nodes
+
+        store = db.MemoryDB()
+        stats = TrieSync(store, self.root, fetch, batch_size=32).run()
+        self.assertEqual(stats.invalid, len(self.source))
+        self.assertEqual(dict(Trie(store, self.root).items()), self.items)
+
+    def test_missingNode(self):
+        with self.assertRaises(Exception):
+            TrieSync(
+                db.MemoryDB(), self.root, lambda hashes: [None] * len(hashes)
+            ).run()
+
+    def test_resumePartialSync(self):
+        store = db.MemoryDB()
+        calls = []
+
+        def fetch(hashes):
+            calls.append(len(hashes))
+            if len(calls) > 5:
+                raise IOError("connection lost")
+            return self.source.multi_get(hashes)
+
+        with self.assertRaises(IOError):
+            TrieSync(
+                store,
+                self.root,
+                fetch,
+                batch_size=8,
+                max_in_flight=1,
+                write_batch_size=1,
+            ).run()
+        stored = len(store)
+        self.assertGreater(stored, 0)
+        # no node is stored without its subtree, so exactly the missing nodes are fetched
+        stats = TrieSync(store, self.root, db_source(self.source)).run()
+        self.assertEqual(stats.nodes, len(self.source) - stored)
+        self.assertEqual(dict(Trie(store, self.root).items()), self.items)
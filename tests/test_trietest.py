@@ -204,6 +204,18 @@ class TrieTest(TestCase):
             == "9f6221ebb8efe7cff60a716ecb886e67dd042014be444669f0159d8e68b42100"
         )
 
+    def test_deleteMissingKey(self):
+        t = Trie(DB_PATH)
+        t.update(b"dog", b"puppy")
+        t.update(b"doge", b"coin")
+        t.update(b"horse", b"stallion")
+        root_node = t.root_node
+        t.delete(b"do")
+        t.delete(b"dogs")
+        t.delete(b"cat")
+        self.assertIs(t.root_node, root_node)
+        self.assertEqual(t.get_value(b"doge"), b"coin")
+
     def _feed_trie(self, test_data: list) -> bytes:
         t = Trie(DB_PATH)
         for data in test_data:
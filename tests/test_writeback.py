@@ -0,0 +1,80 @@
+import asyncio
+import io
+from unittest import TestCase
+
+from mpt import db
+from mpt.aio import AsyncTrie
+from mpt.snapshot import export_snapshot
+from mpt.trie import Trie
+from tests import DB_PATH
+from tests import delete_db_dir
+
+
+class WriteBackTest(TestCase):
+    def tearDown(self):
+        delete_db_dir()
+
+    def test_sameRootHash(self):
+        t = Trie(DB_PATH, write_back=True)
+        t.update(b"doe", b"reindeer")
+        t.update(b"dog", b"puppy")
+        t.update(b"dogglesworth", b"cat")
+        self.assertEqual(
+            t.get_root_hash().hex(),
+            "8aad789dff2f538bca5d8ea56e8abe10f4c7ba3a5dea95fea4cd6e7c3a1168d3",
+        )
+
+    def test_commitOnlyWritesReachableNodes(self):
+        t = Trie(DB_PATH, write_back=True)
+        for i in range(100):
+            t.update(bytes([i]) * 4, b"value" * 10)
+        buffered = len(t._dirty)
+        stats = t.commit()
+        # every update replaces the nodes on its path, so most buffered nodes are garbage by now
+        self.assertLess(stats.nodes, buffered)
+        self.assertGreater(stats.bytes, 0)
+        self.assertEqual(t._dirty, {})
+
+    def test_readAfterCommit(self):
+        t = Trie(DB_PATH, write_back=True)
+        t.update(b"key1aa", b"0123456789012345678901234567890123456789xxx")
+        t.update(b"key1", b"0123456789012345678901234567890123456789Very_Long")
+        root = t.get_root_hash()
+        t.update(b"key2", b"short")
+        self.assertEqual(t.get_value(b"key2"), b"short")
+
+        t.set_root_node(root)
+        self.assertEqual(
+            t.get_value(b"key1"), b"0123456789012345678901234567890123456789Very_Long"
+        )
+        self.assertFalse(t.get_value(b"key2"))
+
+
+class WriteThroughRootTest(TestCase):
+    def setUp(self):
+        self.store = db.MemoryDB()
+        self.trie = Trie(self.store)
+        self.items = {bytes([i]) * 3: b"value" * 8 for i in range(50)}
+        for key, value in self.items.items():
+            self.trie.update(key, value)
+
+    def test_rootIsStored(self):
+        root = self.trie.get_root_hash()
+        self.assertEqual(dict(Trie(self.store, root).items()), self.items)
+
+        self.trie.update(b"new", b"value")
+        new_root = self.trie.get_root_hash()
+        self.assertEqual(
+            list(self.trie.diff(root, new_root)), [(b"new", b"", b"value")]
+        )
+        export_snapshot(self.store, new_root, io.BytesIO())
+        reader = AsyncTrie(self.store, new_root)
+        self.assertEqual(asyncio.run(reader.get_value(b"new")), b"value")
+
+    def test_blankRoot(self):
+        t = Trie(db.MemoryDB())
+        self.assertEqual(Trie(t.db, t.get_root_hash()).get_value(b"a"), b"")
+
+    def test_missingNode(self):
+        with self.assertRaisesRegex(Exception, "missing in the db"):
+            Trie(self.store, b"\x01" * 32)